@@ -0,0 +1,54 @@
+"""
+Promediador de competencias: descarga los outcome_results de cursos de Canvas y
+calcula la distribución de categorías de dominio por competencia y criterio.
+
+No depende de Streamlit: la app (main.py) y la línea de comandos
+(python -m competencias) son interfaces sobre este paquete.
+"""
+from .aggregation import (
+    CATEGORIAS,
+    AcumuladorResultados,
+    UMBRALES,
+    Umbrales,
+    calcular_distribucion_categorias,
+    calcular_distribuciones,
+    clasificar_promedio,
+    clasificar_promedios,
+    validar_umbrales,
+    resultados_a_dataframe,
+    rollups_a_dataframe,
+)
+from .aio import AsyncCanvasClient, ProcesadorAsincrono, procesar_curso_async, procesar_cursos_async
+from .cache import CanvasCache, ResultsStore, SnapshotStore
+from .canvas import (
+    acumular_outcome_results,
+    fetch_all_results,
+    fetch_outcome_rollups,
+    fetch_paginated,
+    iter_pages,
+    gather_outcomes_for_groups,
+    gather_outcomes_with_titles,
+    get_account_course_ids,
+    get_assignments_with_weights,
+    get_course_details,
+    get_outcome_groups,
+    get_user_details,
+    sync_outcome_results,
+)
+from .client import CanvasClient
+from .report import (
+    FUENTE_RESULTADOS,
+    FUENTE_ROLLUPS,
+    FUENTE_STREAMING,
+    FUENTES,
+    FILTRO_GRUPOS,
+    FILTRO_SUBGRUPOS,
+    CursoSinCompetencias,
+    compilar_filtro_grupos,
+    leer_ids_de_csv,
+    leer_ids_de_cursos,
+    procesar_curso,
+    procesar_curso_progresivo,
+    procesar_cursos,
+    tabla_combinada,
+)
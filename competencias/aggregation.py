@@ -0,0 +1,247 @@
+"""
+Cálculo de promedios y distribución de categorías de dominio.
+"""
+from array import array
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from .config import UMBRALES as _UMBRALES
+
+# Categorías de dominio, de mayor a menor, y sus límites inferiores (0..1, ver config.UMBRALES)
+CATEGORIAS = ["Excede el dominio", "Reúne el dominio", "Cerca del dominio", "Muy por debajo del dominio"]
+
+class Umbrales(tuple):
+    """
+    Umbrales ya validados, de la categoría más alta a la más baja (ver validar_umbrales).
+    'limites' los guarda de menor a mayor, listos para np.searchsorted.
+    """
+
+    def __new__(cls, umbrales):
+        umbrales = super().__new__(cls, sorted((float(u) for u in umbrales), reverse=True))
+        if len(umbrales) != len(CATEGORIAS) - 1:
+            raise ValueError(f"Se esperaban {len(CATEGORIAS) - 1} umbrales (uno por categoría salvo la última): "
+                             f"{list(umbrales)}")
+        umbrales.limites = np.array(umbrales[::-1])
+        return umbrales
+
+def validar_umbrales(umbrales):
+    """
+    Ordena los umbrales de mayor a menor y comprueba que haya uno por categoría salvo la última.
+    Devuelve Umbrales (unos ya validados se devuelven tal cual, sin volver a procesarlos).
+    Lanza ValueError si no calzan con CATEGORIAS.
+    """
+    return umbrales if isinstance(umbrales, Umbrales) else Umbrales(umbrales)
+
+UMBRALES = validar_umbrales(_UMBRALES)
+# Los promedios se redondean antes de clasificar para que el ruido de punto flotante
+# (p. ej. 0.39999999999999997) no cambie la categoría de un promedio exacto.
+DECIMALES_PROMEDIO = 9
+
+def clasificar_promedio(promedio, umbrales=None):
+    """
+    Devuelve la categoría en base al promedio (0..1): la primera cuyo umbral alcanza.
+    'umbrales' (por defecto UMBRALES, configurable) va de la categoría más alta a la más baja.
+    """
+    umbrales = UMBRALES if umbrales is None else validar_umbrales(umbrales)
+    for categoria, umbral in zip(CATEGORIAS, umbrales):
+        if promedio >= umbral:
+            return categoria
+    return CATEGORIAS[-1]
+
+def calcular_distribucion_categorias(user_to_scores, umbrales=None):
+    """
+    Dado un dict user->[lista_de_scores],
+    calcular cuántos usuarios hay en cada categoría y su porcentaje.
+    Retorna una lista de dicts con "Categoría" y "Porcentaje".
+    """
+    umbrales = UMBRALES if umbrales is None else validar_umbrales(umbrales)
+    categorias_count = defaultdict(int)
+    total_users = len(user_to_scores)
+
+    for _, scores in user_to_scores.items():
+        # Filtrar valores None y asegurarse de que sean floats
+        valid_scores = [s for s in scores if isinstance(s, (int, float))]
+
+        if valid_scores:
+            promedio = round(sum(valid_scores) / len(valid_scores), DECIMALES_PROMEDIO)
+        else:
+            promedio = 0.0
+        cat = clasificar_promedio(promedio, umbrales)
+        categorias_count[cat] += 1
+
+    data_distribution = []
+    for cat in CATEGORIAS:
+        if total_users > 0:
+            pct = (categorias_count[cat] / total_users) * 100
+        else:
+            pct = 0.0
+        data_distribution.append({
+            "Categoría": cat,
+            "Porcentaje": f"{pct:.1f}%"
+        })
+    return data_distribution
+
+def resultados_a_dataframe(resultados):
+    """
+    Convierte la lista de outcome_results en un DataFrame columnar
+    (user_id, outcome_id, percent). Los percent nulos o no numéricos valen 0.0
+    y se descartan los resultados sin usuario o sin outcome.
+    Los outcome_id quedan como texto para cruzarlos con los ids de los grupos.
+    """
+    links = [res.get("links", {}) for res in resultados]
+    df = pd.DataFrame({
+        "user_id": [link.get("user") for link in links],
+        "outcome_id": [link.get("learning_outcome") for link in links],
+        "percent": [p if isinstance(p, (int, float)) else 0.0
+                    for p in (res.get("percent") for res in resultados)],
+    })
+    df = df[df["user_id"].notna() & (df["user_id"] != "") &
+            df["outcome_id"].notna() & (df["outcome_id"] != "")]
+    return df.astype({"user_id": str, "outcome_id": str, "percent": float})
+
+class AcumuladorResultados:
+    """
+    Suma y cantidad de 'percent' por (usuario, outcome), para agregar los outcome_results
+    página por página sin guardarlos. Los ids se internan como índices enteros y las sumas
+    viven en arreglos compactos: la memoria depende de la cantidad de pares usuario×outcome,
+    no de la cantidad de resultados. Mismos filtros que resultados_a_dataframe.
+    """
+
+    def __init__(self):
+        self._usuarios = {}  # user_id -> índice
+        self._outcomes = {}  # outcome_id -> índice
+        self._pares = {}     # (índice_usuario << 32) | índice_outcome -> posición en los arreglos
+        self._sumas = array("d")
+        self._cantidades = array("q")
+        self.total = 0
+
+    @staticmethod
+    def _indice(tabla, clave):
+        indice = tabla.get(clave)
+        if indice is None:
+            indice = tabla[clave] = len(tabla)
+        return indice
+
+    def agregar(self, resultados):
+        """Suma una página de outcome_results."""
+        for res in resultados:
+            links = res.get("links", {})
+            user_id, outcome_id = links.get("user"), links.get("learning_outcome")
+            if user_id is None or user_id == "" or outcome_id is None or outcome_id == "":
+                continue
+            percent = res.get("percent")
+            par = (self._indice(self._usuarios, str(user_id)) << 32) | self._indice(self._outcomes, str(outcome_id))
+            posicion = self._pares.get(par)
+            if posicion is None:
+                posicion = self._pares[par] = len(self._sumas)
+                self._sumas.append(0.0)
+                self._cantidades.append(0)
+            self._sumas[posicion] += percent if isinstance(percent, (int, float)) else 0.0
+            self._cantidades[posicion] += 1
+            self.total += 1
+
+    def a_dataframe(self):
+        """
+        DataFrame (user_id, outcome_id, percent, peso) con el promedio y la cantidad de
+        resultados de cada par: calcular_distribuciones lo pondera por 'peso', así que los
+        promedios de grupo quedan iguales a promediar los resultados uno a uno.
+        """
+        pares = np.fromiter(self._pares, dtype=np.int64, count=len(self._pares))
+        usuarios = np.array(list(self._usuarios), dtype=object)
+        outcomes = np.array(list(self._outcomes), dtype=object)
+        cantidades = np.frombuffer(self._cantidades, dtype=np.int64).astype(float)
+        return pd.DataFrame({
+            "user_id": usuarios[pares >> 32] if len(pares) else np.array([], dtype=object),
+            "outcome_id": outcomes[pares & 0xFFFFFFFF] if len(pares) else np.array([], dtype=object),
+            "percent": np.frombuffer(self._sumas, dtype=np.float64) / cantidades,
+            "peso": cantidades,
+        }).astype({"user_id": str, "outcome_id": str, "percent": float, "peso": float})
+
+def rollups_a_dataframe(rollups, outcomes):
+    """
+    Convierte los outcome_rollups de Canvas en el mismo DataFrame que resultados_a_dataframe,
+    más una columna 'peso' con la cantidad de resultados que resume cada puntaje.
+    El puntaje se lleva a 0..1 con los 'points_possible' del outcome; los outcomes sin
+    puntaje máximo conocido se descartan.
+    """
+    filas = []
+    for rollup in rollups:
+        user_id = rollup.get("links", {}).get("user")
+        for score in rollup.get("scores", []):
+            outcome_id = str(score.get("links", {}).get("outcome"))
+            puntos = (outcomes.get(outcome_id) or {}).get("points_possible")
+            valor = score.get("score")
+            if user_id and puntos and isinstance(valor, (int, float)):
+                filas.append((str(user_id), outcome_id, valor / puntos, score.get("count") or 1))
+    return pd.DataFrame(filas, columns=["user_id", "outcome_id", "percent", "peso"]).astype(
+        {"user_id": str, "outcome_id": str, "percent": float, "peso": float}
+    )
+
+def clasificar_promedios(promedios, umbrales=None):
+    """
+    Versión vectorizada de clasificar_promedio: recibe una Serie de promedios
+    y devuelve una Serie categórica con la categoría de cada uno (los NaN quedan sin categoría).
+    'umbrales' (por defecto UMBRALES) va de la categoría más alta a la más baja.
+    """
+    limites = (UMBRALES if umbrales is None else validar_umbrales(umbrales)).limites
+    valores = promedios.round(DECIMALES_PROMEDIO).to_numpy(dtype=float)
+    # Cantidad de límites alcanzados = posición en las categorías de menor a mayor
+    codigos = np.where(np.isnan(valores), -1, np.searchsorted(limites, valores, side="right"))
+    return pd.Series(pd.Categorical.from_codes(codigos, categories=CATEGORIAS[::-1], ordered=True),
+                     index=promedios.index, name=promedios.name)
+
+def distribuciones_desde_promedios(promedios, claves, umbrales=None):
+    """
+    Dado un DataFrame (clave, user_id, promedio), arma la tabla de distribución
+    de categorías de cada clave. Las claves sin usuarios quedan en 0.0%.
+    Retorna {clave: [{"Categoría": ..., "Porcentaje": ...}, ...]}.
+    """
+    conteos = pd.crosstab(promedios["clave"], clasificar_promedios(promedios["promedio"], umbrales))
+    conteos = conteos.reindex(index=claves, columns=CATEGORIAS, fill_value=0)
+    totales = conteos.sum(axis=1).replace(0, 1)
+    porcentajes = conteos.div(totales, axis=0) * 100
+
+    return {
+        clave: [{"Categoría": cat, "Porcentaje": f"{pct:.1f}%"} for cat, pct in fila.items()]
+        for clave, fila in zip(claves, porcentajes.to_dict("records"))
+    }
+
+def calcular_distribuciones(resultados_df, grupo_to_outcomes_info, umbrales=None):
+    """
+    Calcula en una sola pasada la distribución de categorías de cada grupo
+    (promediando todos los scores de sus outcomes por usuario) y de cada criterio.
+    Si resultados_df trae una columna 'peso' (rollups), el promedio es ponderado.
+    'umbrales' reemplaza a UMBRALES (ver clasificar_promedio).
+
+    Retorna (dist_grupos, dist_criterios):
+    - dist_grupos: {group_title: [{"Categoría", "Porcentaje"}, ...]}
+    - dist_criterios: {outcome_id: [{"Categoría", "Porcentaje"}, ...]}
+    """
+    umbrales = UMBRALES if umbrales is None else validar_umbrales(umbrales)
+
+    # Tabla (clave, outcome_id): cada grupo apunta a sus outcomes y cada criterio a sí mismo.
+    # Las claves son posiciones: primero los grupos y luego los criterios.
+    titulos = list(grupo_to_outcomes_info)
+    criterios = list(dict.fromkeys(oid for outcomes in grupo_to_outcomes_info.values() for oid, _ in outcomes))
+    miembros = [(i, str(oid)) for i, titulo in enumerate(titulos) for oid, _ in grupo_to_outcomes_info[titulo]]
+    miembros += [(len(titulos) + j, str(oid)) for j, oid in enumerate(criterios)]
+    mapa = pd.DataFrame(miembros, columns=["clave", "outcome_id"])
+
+    unidos = mapa.merge(resultados_df, on="outcome_id")
+    if "peso" in unidos:
+        unidos = unidos.assign(percent=unidos["percent"] * unidos["peso"])
+        sumas = unidos.groupby(["clave", "user_id"], sort=False)[["percent", "peso"]].sum()
+        promedios = (sumas["percent"] / sumas["peso"]).rename("promedio").reset_index()
+    else:
+        promedios = (
+            unidos.groupby(["clave", "user_id"], sort=False)["percent"].mean()
+            .rename("promedio")
+            .reset_index()
+        )
+    distribuciones = distribuciones_desde_promedios(promedios, range(len(titulos) + len(criterios)), umbrales)
+
+    dist_grupos = {titulo: distribuciones[i] for i, titulo in enumerate(titulos)}
+    dist_criterios = {oid: distribuciones[len(titulos) + j] for j, oid in enumerate(criterios)}
+    return dist_grupos, dist_criterios
@@ -0,0 +1,462 @@
+"""
+Capa asíncrona (asyncio + httpx) sobre la API de Canvas.
+
+Todas las descargas de un curso (outcome_results, grupos y árbol de cada competencia,
+curso y subcuenta) se lanzan en un mismo event loop y se solapan; un asyncio.Semaphore
+acota cuántas peticiones hay en vuelo. Solo cambia cómo se descarga: la lectura de cada
+respuesta, la copia local de outcome_results (ResultsStore), la caché en disco y las
+reglas del cálculo son las mismas funciones de canvas.py y report.py, así que ambos
+caminos devuelven lo mismo. Los errores se traducen a los de requests (HTTPError,
+ConnectionError, Timeout) para que el resto del paquete los maneje igual.
+
+Desde código sincrónico (la app de Streamlit) se usa a través de ProcesadorAsincrono.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import Future
+from contextvars import copy_context
+from itertools import islice
+import threading
+
+import httpx
+import requests
+
+from .aggregation import AcumuladorResultados, resultados_a_dataframe, rollups_a_dataframe, validar_umbrales
+from .cache import CanvasCache
+from .canvas import (
+    _aplanar_arbol,
+    _check_results_page,
+    _datos_del_curso,
+    _error_de_resultados,
+    _error_de_tareas,
+    _guardar_nombres,
+    _guardar_sincronizacion,
+    _last_page,
+    _leer_linked,
+    _nodo_del_grupo,
+    _nombre_de_usuario,
+    _nombres_en_cache,
+    _nombres_usuarios,
+    _page_items,
+    _ponderar_tareas,
+    _ruta_cursos_de_cuenta,
+    _siguiente_nivel,
+    _url_paginada,
+)
+from .client import _CanvasBase
+from .config import BATCH_WORKERS, MAX_WORKERS
+from .metrics import etapa, registrar_cache, registrar_peticion
+from .report import (
+    FILTRO_GRUPOS,
+    FILTRO_SUBGRUPOS,
+    FUENTE_RESULTADOS,
+    FUENTE_ROLLUPS,
+    FUENTE_STREAMING,
+    CursoSinCompetencias,
+    _cerrar_resumen,
+    _error_de_rollups,
+    _filtrar_grupos,
+    _nuevo_resumen,
+    _sin_grupos,
+    _sumar_competencia,
+    _ultimo_con_outcomes,
+    compilar_filtro_grupos,
+)
+
+class AsyncCanvasClient(_CanvasBase):
+    """
+    Cliente asíncrono de la API de Canvas sobre httpx.AsyncClient.
+    - A lo más 'max_concurrency' peticiones en vuelo (asyncio.Semaphore) y un pool del mismo tamaño.
+    - Los mismos reintentos que CanvasClient (429, 403 por rate limit, 5xx y errores de red),
+      esperando con asyncio.sleep. El límite es fijo: no se adapta a X-Rate-Limit-Remaining.
+    - Comparte la caché en disco (CanvasCache) y su ámbito por token con CanvasClient.
+    Se cierra con 'await client.aclose()' o usándolo como 'async with'.
+    """
+
+    def __init__(self, base_url, token, max_concurrency=MAX_WORKERS, max_retries=5,
+                 backoff=0.5, timeout=30, cache=None):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.cache_scope = CanvasCache.scope(token)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._http = httpx.AsyncClient(
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self._limite = asyncio.Semaphore(max_concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def get(self, path, params=None, headers=None):
+        """
+        GET con caché y reintentos, como CanvasClient.get. Devuelve el último Response obtenido
+        (de httpx, o de requests si sale de la caché). Lanza ConnectionError/Timeout de requests
+        si fallan todos los intentos por errores de red.
+        """
+        url = self._url_con_params(path, params)
+        if self.cache is None or self.cache.ttl_for(url) is None:
+            response = await self._get(url, headers)
+            if response.status_code == 304:
+                registrar_cache()  # El llamador ya tiene una copia (p. ej. ResultsStore)
+            return response
+
+        cached = self.cache.lookup(self.cache_scope, url)
+        if cached is None:
+            response = await self._get(url)
+        else:
+            cached_response, etag, fresh = cached
+            if fresh:
+                registrar_cache()
+                return cached_response
+            response = await self._get(url, {"If-None-Match": etag} if etag else None)
+            if response.status_code == 304:
+                self.cache.touch(self.cache_scope, url)
+                registrar_cache()
+                return cached_response
+
+        if response.status_code == 200:
+            self.cache.store(self.cache_scope, url, response)
+        return response
+
+    async def _get(self, url, headers=None):
+        for attempt in range(self.max_retries + 1):
+            response = None
+            async with self._limite:
+                try:
+                    response = await self._http.get(url, headers=headers)
+                except httpx.TimeoutException as e:
+                    if attempt == self.max_retries:
+                        raise requests.exceptions.Timeout(str(e)) from e
+                except httpx.TransportError as e:
+                    if attempt == self.max_retries:
+                        raise requests.exceptions.ConnectionError(str(e)) from e
+                finally:
+                    registrar_peticion(len(response.content) if response is not None else 0, reintento=attempt > 0)
+
+            if response is not None and not self._should_retry(response):
+                return response
+            if attempt < self.max_retries:
+                await asyncio.sleep(self._delay(attempt, response))
+        return response
+
+    async def get_ok(self, path, params=None):
+        """GET que lanza HTTPError (de requests) si la respuesta no es exitosa."""
+        response = await self.get(path, params=params)
+        if response.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{response.status_code} Error: {response.url}", response=response)
+        return response
+
+    async def get_json(self, path, params=None):
+        """GET que lanza HTTPError si la respuesta no es exitosa y devuelve el JSON."""
+        return (await self.get_ok(path, params=params)).json()
+
+async def iter_pages_async(client, path):
+    """
+    Versión asíncrona de canvas.iter_pages: con rel="last" pide las páginas 2..N a la vez,
+    con a lo más 2*max_concurrency descargadas sin consumir; si no, sigue rel="next".
+    Entrega el JSON de cada página, en orden. Lanza HTTPError si alguna página falla.
+    """
+    url = _url_paginada(client, path)
+    first = await client.get_ok(f"{url}&page=1")
+    yield first.json()
+    last_page = _last_page(first)
+
+    if last_page is None:
+        response = first
+        while "next" in response.links:
+            response = await client.get_ok(response.links["next"]["url"])
+            yield response.json()
+        return
+
+    siguientes = iter(range(2, last_page + 1))
+    pendientes = deque(asyncio.ensure_future(client.get_ok(f"{url}&page={page}"))
+                       for page in islice(siguientes, 2 * client.max_concurrency))
+    try:
+        while pendientes:
+            response = await pendientes.popleft()
+            for page in islice(siguientes, 1):
+                pendientes.append(asyncio.ensure_future(client.get_ok(f"{url}&page={page}")))
+            yield response.json()
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+
+async def fetch_paginated_async(client, path, key=None, on_page=None):
+    """Versión asíncrona de canvas.fetch_paginated."""
+    items = []
+    async for data in iter_pages_async(client, path):
+        if on_page is not None:
+            on_page(data)
+        items.extend(_page_items(data, key))
+    return items
+
+async def fetch_all_results_async(client, course_id):
+    """Versión asíncrona de canvas.fetch_all_results."""
+    try:
+        return await fetch_paginated_async(client, f"courses/{course_id}/outcome_results", key="outcome_results")
+    except requests.exceptions.HTTPError as e:
+        raise _error_de_resultados(e) from e
+
+async def acumular_outcome_results_async(client, course_id, acumulador):
+    """Versión asíncrona de canvas.acumular_outcome_results."""
+    try:
+        async for data in iter_pages_async(client, f"courses/{course_id}/outcome_results"):
+            acumulador.agregar(_page_items(data, "outcome_results"))
+    except requests.exceptions.HTTPError as e:
+        raise _error_de_resultados(e) from e
+    return acumulador
+
+async def sync_outcome_results_async(client, store, course_id):
+    """
+    Versión asíncrona de canvas.sync_outcome_results: la misma copia local y el mismo
+    recorrido (la última página conocida se pide completa para saber el total).
+    """
+    url = _url_paginada(client, f"courses/{course_id}/outcome_results")
+    known_last_page, etags = store.state(client.cache_scope, course_id)
+
+    async def fetch_page(page, page_url=None, revalidar=True):
+        etag = etags.get(page) if revalidar else None
+        response = await client.get(page_url or f"{url}&page={page}",
+                                    headers={"If-None-Match": etag} if etag else None)
+        return _check_results_page(response, page)
+
+    # Páginas ya conocidas: todas con ETag salvo la última, que da el total de páginas
+    probe = known_last_page or 1
+    pages = range(1, probe)
+    *anteriores, ultima = await asyncio.gather(*(fetch_page(page) for page in pages), fetch_page(probe, None, False))
+    responses = dict(zip(pages, anteriores))
+    responses[probe] = ultima
+
+    last_page = _last_page(responses[probe])
+    if last_page is not None:
+        pages = range(probe + 1, last_page + 1)
+        responses.update(zip(pages, await asyncio.gather(*(fetch_page(page) for page in pages))))
+    else:
+        response, last_page = responses[probe], probe
+        while "next" in response.links:
+            last_page += 1
+            response = responses[last_page] = await fetch_page(last_page, response.links["next"]["url"])
+
+    return _guardar_sincronizacion(client, store, course_id, responses, last_page)
+
+async def fetch_outcome_rollups_async(client, course_id):
+    """Versión asíncrona de canvas.fetch_outcome_rollups."""
+    outcomes = {}
+    rollups = await fetch_paginated_async(client, f"courses/{course_id}/outcome_rollups?include[]=outcomes",
+                                          key="rollups", on_page=_leer_linked(outcomes))
+    return rollups, outcomes
+
+async def get_outcome_groups_async(course_id, client):
+    """Versión asíncrona de canvas.get_outcome_groups."""
+    return await fetch_paginated_async(client, f"courses/{course_id}/outcome_groups")
+
+async def _fetch_group_node_async(course_id, group_id, client, filtro_subgrupos=None):
+    outcome_links, subgroups = await asyncio.gather(
+        fetch_paginated_async(client, f"courses/{course_id}/outcome_groups/{group_id}/outcomes"),
+        fetch_paginated_async(client, f"courses/{course_id}/outcome_groups/{group_id}/subgroups",
+                              key="outcome_groups"),
+    )
+    return _nodo_del_grupo(outcome_links, subgroups, filtro_subgrupos)
+
+async def gather_outcomes_for_groups_async(course_id, group_ids, client, filtro_subgrupos=None):
+    """Versión asíncrona de canvas.gather_outcomes_for_groups (mismo recorrido por niveles)."""
+    nodes = {}
+    level = list(dict.fromkeys(group_ids))
+    while level:
+        fetched = await asyncio.gather(*(_fetch_group_node_async(course_id, gid, client, filtro_subgrupos)
+                                         for gid in level))
+        level = _siguiente_nivel(nodes, level, fetched)
+    return _aplanar_arbol(nodes, group_ids)
+
+async def get_course_details_async(course_id, client):
+    """Versión asíncrona de canvas.get_course_details."""
+    course_data = await client.get_json(f"courses/{course_id}")
+    account_resp = await client.get(f"accounts/{course_data.get('account_id', '')}")
+    return _datos_del_curso(course_id, course_data, account_resp)
+
+async def get_assignments_with_weights_async(course_id, client):
+    """Versión asíncrona de canvas.get_assignments_with_weights (los dos listados a la vez)."""
+    try:
+        assignment_groups, assignments = await asyncio.gather(
+            fetch_paginated_async(client, f"courses/{course_id}/assignment_groups"),
+            fetch_paginated_async(client, f"courses/{course_id}/assignments"),
+        )
+    except requests.exceptions.RequestException as e:
+        raise _error_de_tareas(e) from e
+    return _ponderar_tareas(assignment_groups, assignments)
+
+async def _get_user_name_async(user_id, client):
+    try:
+        return _nombre_de_usuario(await client.get(f"users/{user_id}"))
+    except requests.exceptions.RequestException as e:
+        return f"Error: {e}", False
+
+async def get_user_details_async(user_ids, client, course_id=None):
+    """Versión asíncrona de canvas.get_user_details (misma caché LRU de nombres)."""
+    nombres, faltantes = _nombres_en_cache(client, user_ids)
+    if faltantes and course_id is not None:
+        try:
+            _guardar_nombres(client, nombres, await fetch_paginated_async(client, f"courses/{course_id}/users"))
+        except requests.exceptions.HTTPError:
+            pass  # Sin permiso para listar el curso: se piden uno a uno
+        faltantes = [uid for uid in faltantes if uid not in nombres]
+
+    for uid, (name, cacheable) in zip(faltantes, await asyncio.gather(
+            *(_get_user_name_async(uid, client) for uid in faltantes))):
+        if cacheable:
+            _nombres_usuarios.put((client.base_url, uid), name)
+        nombres[uid] = name
+
+    return [{"user_id": user_id, "name": nombres[str(user_id)]} for user_id in user_ids]
+
+async def get_account_course_ids_async(account_id, client, include_subaccounts=True):
+    """Versión asíncrona de canvas.get_account_course_ids."""
+    cursos = await fetch_paginated_async(client, _ruta_cursos_de_cuenta(account_id, include_subaccounts))
+    return [str(c["id"]) for c in cursos if c.get("id")]
+
+async def _cargar_async(client, store, course_id, fuente):
+    """Versión asíncrona de report._cargador(fuente): (resultados_df, total, novedades)."""
+    if fuente == FUENTE_ROLLUPS:
+        try:
+            rollups, outcomes = await fetch_outcome_rollups_async(client, course_id)
+        except requests.exceptions.HTTPError as e:
+            raise _error_de_rollups(e) from e
+        return rollups_a_dataframe(rollups, outcomes), len(rollups), None
+    if fuente == FUENTE_STREAMING:
+        acumulador = await acumular_outcome_results_async(client, course_id, AcumuladorResultados())
+        return acumulador.a_dataframe(), acumulador.total, None
+    resultados, novedades = await sync_outcome_results_async(client, store, course_id)
+    return resultados_a_dataframe(resultados), len(resultados), novedades
+
+async def _outcomes_de_titulo_async(course_id, group_ids, client, filtro_subgrupos=None):
+    outcomes_por_grupo = await gather_outcomes_for_groups_async(course_id, group_ids, client, filtro_subgrupos)
+    return _ultimo_con_outcomes(outcomes_por_grupo, group_ids)
+
+async def _en_etapa(nombre, corrutina):
+    """Mide 'corrutina' como la etapa 'nombre' (ver metrics.en_etapa)."""
+    with etapa(nombre):
+        return await corrutina
+
+async def procesar_curso_async(client, store, course_id, fuente=FUENTE_RESULTADOS, filtro=FILTRO_GRUPOS,
+                               filtro_subgrupos=FILTRO_SUBGRUPOS, umbrales=None):
+    """
+    report.procesar_curso sobre un AsyncCanvasClient: los outcome_results, el curso, los
+    grupos y el árbol de cada competencia se descargan a la vez en el event loop.
+    Mismos parámetros, mismo dict y mismas excepciones (las reglas del cálculo son las de report).
+    """
+    if umbrales is not None:
+        umbrales = validar_umbrales(umbrales)
+    if filtro_subgrupos is not None:
+        filtro_subgrupos = compilar_filtro_grupos(filtro_subgrupos)
+
+    tareas = []
+
+    def lanzar(corrutina):
+        tarea = asyncio.ensure_future(corrutina)
+        tareas.append(tarea)
+        return tarea
+
+    try:
+        t_resultados = lanzar(_en_etapa("resultados", _cargar_async(client, store, course_id, fuente)))
+        t_curso = lanzar(_en_etapa("curso", get_course_details_async(course_id, client)))
+
+        # 1) Grupos del curso: apenas se conocen, se lanza la descarga del árbol de cada uno
+        with etapa("grupos"):
+            grupos_filtrados = _filtrar_grupos(await get_outcome_groups_async(course_id, client),
+                                               compilar_filtro_grupos(filtro))
+        if not grupos_filtrados:
+            raise _sin_grupos((await t_resultados)[1])
+        t_arboles = {titulo: lanzar(_en_etapa("árbol", _outcomes_de_titulo_async(course_id, gids, client,
+                                                                                 filtro_subgrupos)))
+                     for titulo, gids in grupos_filtrados.items() if gids}
+
+        # 2) Información del curso y outcome_results
+        course_info = await t_curso
+        resultados_df, total_resultados, novedades = await t_resultados
+        resumen = _nuevo_resumen(course_info, total_resultados, novedades, fuente)
+
+        # 3) Cada competencia, en el orden de Canvas
+        for titulo, tarea in t_arboles.items():
+            _sumar_competencia(resumen, resultados_df, titulo, await tarea, umbrales)
+        return _cerrar_resumen(resumen, grupos_filtrados)
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+async def procesar_cursos_async(client, store, course_ids, max_cursos=BATCH_WORKERS, fuente=FUENTE_RESULTADOS,
+                                **opciones):
+    """
+    Procesa varios cursos, a lo más 'max_cursos' a la vez ('opciones': filtro,
+    filtro_subgrupos, umbrales). Retorna (resumenes, errores) como report.procesar_cursos.
+    """
+    limite = asyncio.Semaphore(max_cursos)
+
+    async def uno(cid):
+        async with limite:
+            return await procesar_curso_async(client, store, cid, fuente, **opciones)
+
+    salidas = await asyncio.gather(*(uno(cid) for cid in course_ids), return_exceptions=True)
+    resumenes, errores = [], {}
+    for cid, salida in zip(course_ids, salidas):
+        if isinstance(salida, (CursoSinCompetencias, RuntimeError, requests.exceptions.RequestException)):
+            errores[cid] = str(salida)
+        elif isinstance(salida, BaseException):
+            raise salida
+        else:
+            resumenes.append((cid, salida))
+    return resumenes, errores
+
+class ProcesadorAsincrono:
+    """
+    Envoltura síncrona de la capa asíncrona, para código sin event loop (la app de Streamlit).
+    Corre un event loop propio en un hilo de fondo con un único AsyncCanvasClient: todas las
+    llamadas, desde cualquier hilo, comparten sus conexiones y su límite de peticiones.
+    Las métricas activas en el hilo que llama (metrics.instrumentar) se propagan al loop.
+    """
+
+    def __init__(self, base_url, token, cache=None, max_concurrency=MAX_WORKERS):
+        self._loop = asyncio.new_event_loop()
+        self._hilo = threading.Thread(target=self._loop.run_forever, name="competencias-aio", daemon=True)
+        self._hilo.start()
+        self.client = AsyncCanvasClient(base_url, token, max_concurrency=max_concurrency, cache=cache)
+
+    def ejecutar(self, corrutina):
+        """Ejecuta 'corrutina' en el loop de fondo y espera su resultado (o relanza su excepción)."""
+        future = Future()
+
+        def copiar(tarea):
+            if tarea.cancelled():
+                future.cancel()
+            elif tarea.exception() is not None:
+                future.set_exception(tarea.exception())
+            else:
+                future.set_result(tarea.result())
+
+        def lanzar():
+            # La tarea copia el contexto en el que corre este callback: el del hilo que llama
+            asyncio.ensure_future(corrutina).add_done_callback(copiar)
+
+        self._loop.call_soon_threadsafe(lanzar, context=copy_context())
+        return future.result()
+
+    def procesar_curso(self, store, course_id, fuente=FUENTE_RESULTADOS, **opciones):
+        """procesar_curso_async, bloqueando hasta que termina ('opciones': filtro, filtro_subgrupos, umbrales)."""
+        return self.ejecutar(procesar_curso_async(self.client, store, course_id, fuente, **opciones))
+
+    def close(self):
+        """Cierra las conexiones y detiene el loop de fondo."""
+        self.ejecutar(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._hilo.join()
+        self._loop.close()
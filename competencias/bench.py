@@ -0,0 +1,112 @@
+"""
+Benchmark de punta a punta contra el servidor local de fake_canvas. Mide, por etapa,
+el tiempo real, las peticiones HTTP, los bytes recibidos y el pico de memoria de Python.
+
+    python -m competencias bench --students 500 --outcomes 4 --depth 2 --latency 0.02
+
+El pico de memoria se mide con tracemalloc, que hace más lento todo lo que mide: para
+comparar tiempos entre versiones conviene usar --no-memory.
+"""
+import time
+import tracemalloc
+
+from .aggregation import AcumuladorResultados, calcular_distribuciones, resultados_a_dataframe
+from .aio import ProcesadorAsincrono
+from .cache import ResultsStore
+from .canvas import (
+    acumular_outcome_results,
+    fetch_all_results,
+    gather_outcomes_for_groups,
+    get_assignments_with_weights,
+    get_outcome_groups,
+)
+from .client import CanvasClient
+from .fake_canvas import CursoSintetico, FakeCanvas
+from .report import FUENTE_STREAMING, _filtrar_grupos, procesar_curso
+
+def medir(etapa, funcion, canvas, memoria=True):
+    """Ejecuta 'funcion()' y devuelve (resultado, fila con las métricas de la etapa)."""
+    canvas.reiniciar_contadores()
+    if memoria:
+        tracemalloc.start()
+    inicio = time.perf_counter()
+    try:
+        resultado = funcion()
+        segundos = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] if memoria else None
+    finally:
+        if memoria:
+            tracemalloc.stop()
+    return resultado, {
+        "etapa": etapa,
+        "segundos": round(segundos, 3),
+        "peticiones": canvas.peticiones,
+        "kb_recibidos": round(canvas.bytes_enviados / 1024, 1),
+        "memoria_pico_mb": round(pico / 2 ** 20, 2) if pico is not None else None,
+    }
+
+def run_benchmark(estudiantes=200, competencias=3, criterios=3, profundidad=1, ramas=2,
+                  latencia=0.0, max_workers=None, memoria=True, semilla=0):
+    """
+    Genera un curso sintético, lo sirve localmente y mide cada etapa del cálculo.
+    Devuelve una lista de filas (dicts) en el orden en que se ejecutaron las etapas.
+    """
+    curso = CursoSintetico(1, estudiantes=estudiantes, competencias=competencias, criterios=criterios,
+                           profundidad=profundidad, ramas=ramas, semilla=semilla)
+    course_id = str(curso.course_id)
+    filas = []
+
+    with FakeCanvas([curso], latencia=latencia) as canvas:
+        def cliente():
+            # Sin caché HTTP: cada etapa mide las descargas completas
+            kwargs = {"max_workers": max_workers} if max_workers else {}
+            return CanvasClient(canvas.base_url, "token-benchmark", **kwargs)
+
+        client = cliente()
+        resultados, fila = medir("outcome_results (fetch_all_results)",
+                                 lambda: fetch_all_results(client, course_id), canvas, memoria)
+        filas.append(fila)
+        _, fila = medir("outcome_results en streaming (acumular_outcome_results)",
+                        lambda: acumular_outcome_results(client, course_id, AcumuladorResultados()).a_dataframe(),
+                        canvas, memoria)
+        filas.append(fila)
+
+        grupos = _filtrar_grupos(get_outcome_groups(course_id, client))
+        group_ids = [gid for gids in grupos.values() for gid in gids]
+        outcomes_por_grupo, fila = medir("árboles de competencias (gather_outcomes_for_groups)",
+                                         lambda: gather_outcomes_for_groups(course_id, group_ids, client),
+                                         canvas, memoria)
+        filas.append(fila)
+
+        grupo_to_outcomes = {titulo: [o for gid in gids for o in outcomes_por_grupo[gid]]
+                             for titulo, gids in grupos.items()}
+        _, fila = medir("agregación (calcular_distribuciones)",
+                        lambda: calcular_distribuciones(resultados_a_dataframe(resultados), grupo_to_outcomes),
+                        canvas, memoria)
+        filas.append(fila)
+
+        _, fila = medir("tareas y ponderación (get_assignments_with_weights)",
+                        lambda: get_assignments_with_weights(course_id, client), canvas, memoria)
+        filas.append(fila)
+
+        store = ResultsStore(":memory:")
+        _, fila = medir("procesar_curso (sin copia local)",
+                        lambda: procesar_curso(cliente(), store, course_id), canvas, memoria)
+        filas.append(fila)
+        _, fila = medir("procesar_curso (revalidando con ETag)",
+                        lambda: procesar_curso(cliente(), store, course_id), canvas, memoria)
+        filas.append(fila)
+        _, fila = medir("procesar_curso en streaming",
+                        lambda: procesar_curso(cliente(), store, course_id, FUENTE_STREAMING), canvas, memoria)
+        filas.append(fila)
+
+        kwargs = {"max_concurrency": max_workers} if max_workers else {}
+        procesador = ProcesadorAsincrono(canvas.base_url, "token-benchmark", **kwargs)
+        try:
+            _, fila = medir("procesar_curso asíncrono (httpx, sin copia local)",
+                            lambda: procesador.procesar_curso(ResultsStore(":memory:"), course_id), canvas, memoria)
+            filas.append(fila)
+        finally:
+            procesador.close()
+
+    return filas
@@ -0,0 +1,330 @@
+"""
+Persistencia local en SQLite: caché de respuestas de Canvas, copia de los outcome_results
+e instantáneas de las distribuciones ya calculadas.
+"""
+from datetime import date, datetime
+from urllib.parse import urlparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+import pandas as pd
+
+from .aggregation import CATEGORIAS
+from .config import CACHE_MAX_BYTES, CACHE_PATH, CACHE_TTLS, SNAPSHOTS_PATH
+
+class CanvasCache:
+    """
+    Caché persistente (SQLite) de respuestas GET de Canvas.
+    - La clave es la URL más un hash del token, para no mezclar permisos entre tokens.
+    - Cada entrada guarda su ETag para revalidar con If-None-Match cuando vence el TTL.
+    - Si el archivo supera max_bytes se eliminan las entradas menos usadas.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES, ttls=CACHE_TTLS):
+        self.max_bytes = max_bytes
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, scope TEXT, url TEXT, etag TEXT, link TEXT,"
+            " body BLOB, size INTEGER, stored_at REAL, accessed_at REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def scope(token):
+        """Identificador estable del token, sin guardarlo en claro."""
+        return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    def ttl_for(self, url):
+        """Devuelve el TTL del recurso o None si no se debe cachear."""
+        path = urlparse(url).path
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return None
+
+    def lookup(self, scope, url):
+        """Devuelve (response, etag, fresco) o None si no hay entrada."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, link, body, stored_at FROM responses WHERE key = ?",
+                (f"{scope}:{url}",),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                               (time.time(), f"{scope}:{url}"))
+            self._conn.commit()
+        etag, link, body, stored_at = row
+        fresh = time.time() - stored_at < (self.ttl_for(url) or 0)
+        return self._to_response(url, etag, link, body), etag, fresh
+
+    def store(self, scope, url, response):
+        now = time.time()
+        body = response.content
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (f"{scope}:{url}", scope, url, response.headers.get("ETag"),
+                 response.headers.get("Link"), body, len(body), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, scope, url):
+        """Marca una entrada como fresca tras un 304 Not Modified."""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET stored_at = ? WHERE key = ?",
+                               (time.time(), f"{scope}:{url}"))
+            self._conn.commit()
+
+    def expire(self, scope):
+        """Vence todas las entradas de un token: la próxima lectura revalida contra Canvas."""
+        with self._lock:
+            self._conn.execute("UPDATE responses SET stored_at = 0 WHERE scope = ?", (scope,))
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def _to_response(url, etag, link, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = body
+        response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+        if etag:
+            response.headers["ETag"] = etag
+        if link:
+            response.headers["Link"] = link
+        return response
+
+class ResultsStore:
+    """
+    Copia local (SQLite) de los outcome_results de cada curso, para sincronizar
+    de forma incremental en lugar de re-descargar todo.
+    - Cada resultado se guarda por id junto a su 'submitted_or_assessed_at' y la página de donde vino.
+    - Se guarda el ETag de cada página: las páginas sin cambios responden 304 y no se re-descargan.
+    """
+
+    def __init__(self, path=CACHE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " scope TEXT, course_id TEXT, result_id TEXT, page INTEGER, position INTEGER,"
+            " assessed_at TEXT, payload TEXT, PRIMARY KEY (scope, course_id, result_id));"
+            "CREATE TABLE IF NOT EXISTS result_pages ("
+            " scope TEXT, course_id TEXT, page INTEGER, etag TEXT,"
+            " PRIMARY KEY (scope, course_id, page));"
+            "CREATE TABLE IF NOT EXISTS result_syncs ("
+            " scope TEXT, course_id TEXT, last_page INTEGER, synced_at REAL,"
+            " PRIMARY KEY (scope, course_id));"
+        )
+        self._conn.commit()
+
+    def state(self, scope, course_id):
+        """Devuelve (last_page, {page: etag}) de la última sincronización."""
+        key = (scope, str(course_id))
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_page FROM result_syncs WHERE scope = ? AND course_id = ?", key
+            ).fetchone()
+            etags = dict(self._conn.execute(
+                "SELECT page, etag FROM result_pages WHERE scope = ? AND course_id = ?", key
+            ).fetchall())
+        if row is None:
+            return None, {}
+        return row[0], etags
+
+    def assessed_at(self, scope, course_id):
+        """Devuelve {result_id: submitted_or_assessed_at} de lo ya guardado."""
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT result_id, assessed_at FROM results WHERE scope = ? AND course_id = ?",
+                (scope, str(course_id)),
+            ).fetchall())
+
+    def save(self, scope, course_id, changed_pages, last_page):
+        """
+        Reemplaza las páginas que cambiaron ({page: (etag, items)}) y descarta las
+        que ya no existen, en una sola transacción.
+        """
+        key = (scope, str(course_id))
+        with self._lock, self._conn:
+            for page, (etag, items) in changed_pages.items():
+                self._conn.execute(
+                    "DELETE FROM results WHERE scope = ? AND course_id = ? AND page = ?", key + (page,)
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [key + (outcome_result_key(item, page, pos), page, pos,
+                            item.get("submitted_or_assessed_at"), json.dumps(item))
+                     for pos, item in enumerate(items)],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO result_pages VALUES (?, ?, ?, ?)", key + (page, etag)
+                )
+            self._conn.execute(
+                "DELETE FROM results WHERE scope = ? AND course_id = ? AND page > ?", key + (last_page,)
+            )
+            self._conn.execute(
+                "DELETE FROM result_pages WHERE scope = ? AND course_id = ? AND page > ?", key + (last_page,)
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO result_syncs (scope, course_id, last_page, synced_at) VALUES (?, ?, ?, ?)",
+                key + (last_page, time.time()),
+            )
+
+    def results(self, scope, course_id):
+        """Devuelve los outcome_results guardados, en orden de página."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM results WHERE scope = ? AND course_id = ? ORDER BY page, position",
+                (scope, str(course_id)),
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def reset(self, scope, course_id):
+        """Olvida la copia local de un curso: la próxima sincronización será completa."""
+        key = (scope, str(course_id))
+        with self._lock, self._conn:
+            for table in ("results", "result_pages", "result_syncs"):
+                self._conn.execute(f"DELETE FROM {table} WHERE scope = ? AND course_id = ?", key)
+
+class SnapshotStore:
+    """
+    Instantáneas (SQLite) de los resultados de procesar_curso, para mostrarlos sin consultar
+    Canvas. Las genera una tarea programada (python -m competencias snapshot).
+    - Una instantánea por curso y fecha (recalcular el mismo día la reemplaza).
+    - Las distribuciones se guardan en formato largo: una fila por curso, fecha, competencia,
+      criterio (NULL para la fila de la competencia) y categoría, con índice por curso,
+      competencia y fecha para leer la última o la evolución de una competencia.
+    """
+
+    def __init__(self, path=SNAPSHOTS_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " course_id TEXT, fecha TEXT, creado_en TEXT, fuente TEXT, total_resultados INTEGER,"
+            " course_info TEXT, PRIMARY KEY (course_id, fecha));"
+            "CREATE TABLE IF NOT EXISTS distribuciones ("
+            " course_id TEXT, fecha TEXT, competencia TEXT, criterio_id, criterio TEXT,"
+            " categoria TEXT, porcentaje REAL);"
+            "CREATE INDEX IF NOT EXISTS distribuciones_curso"
+            " ON distribuciones (course_id, competencia, fecha);"
+        )
+        self._conn.commit()
+
+    def save(self, course_id, resumen, fecha=None):
+        """Guarda el resumen de procesar_curso como la instantánea de 'fecha' (hoy por defecto)."""
+        key = (str(course_id), (fecha or date.today()).isoformat())
+        filas = []
+        for competencia, outcomes_list in resumen["grupo_to_outcomes_info"].items():
+            for d in resumen["dist_grupos"][competencia]:
+                filas.append(key + (competencia, None, None, d["Categoría"], _porcentaje(d)))
+            for oid, otitle in outcomes_list:
+                for d in resumen["dist_criterios"][oid]:
+                    filas.append(key + (competencia, oid, otitle, d["Categoría"], _porcentaje(d)))
+
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM distribuciones WHERE course_id = ? AND fecha = ?", key)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                key + (datetime.now().isoformat(timespec="seconds"), resumen.get("fuente"),
+                       resumen.get("total_resultados"), json.dumps(resumen["course_info"])),
+            )
+            self._conn.executemany("INSERT INTO distribuciones VALUES (?, ?, ?, ?, ?, ?, ?)", filas)
+
+    def latest(self, course_id):
+        """
+        La instantánea más reciente de un curso, con la misma forma que el resumen de
+        procesar_curso más 'fecha' y 'creado_en' (novedades es None). None si no hay.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fecha, creado_en, fuente, total_resultados, course_info FROM snapshots"
+                " WHERE course_id = ? ORDER BY fecha DESC LIMIT 1", (str(course_id),)
+            ).fetchone()
+            if row is None:
+                return None
+            filas = self._conn.execute(
+                "SELECT competencia, criterio_id, criterio, categoria, porcentaje FROM distribuciones"
+                " WHERE course_id = ? AND fecha = ? ORDER BY rowid", (str(course_id), row[0])
+            ).fetchall()
+
+        fecha, creado_en, fuente, total_resultados, course_info = row
+        grupo_to_outcomes_info, dist_grupos, dist_criterios = {}, {}, {}
+        for competencia, oid, otitle, categoria, porcentaje in filas:
+            outcomes_list = grupo_to_outcomes_info.setdefault(competencia, [])
+            celda = {"Categoría": categoria, "Porcentaje": f"{porcentaje:.1f}%"}
+            if oid is None:
+                dist_grupos.setdefault(competencia, []).append(celda)
+                continue
+            if (oid, otitle) not in outcomes_list:
+                outcomes_list.append((oid, otitle))
+                dist_criterios[oid] = []
+            if len(dist_criterios[oid]) < len(dist_grupos[competencia]):
+                dist_criterios[oid].append(celda)
+
+        return {
+            "course_info": json.loads(course_info),
+            "grupo_to_outcomes_info": grupo_to_outcomes_info,
+            "dist_grupos": dist_grupos,
+            "dist_criterios": dist_criterios,
+            "total_resultados": total_resultados,
+            "novedades": None,
+            "fuente": fuente,
+            "fecha": fecha,
+            "creado_en": creado_en,
+        }
+
+    def dates(self, course_id):
+        """Fechas con instantánea de un curso, de la más antigua a la más reciente."""
+        with self._lock:
+            return [fecha for (fecha,) in self._conn.execute(
+                "SELECT fecha FROM snapshots WHERE course_id = ? ORDER BY fecha", (str(course_id),)
+            ).fetchall()]
+
+    def trend(self, course_id, competencia):
+        """
+        Evolución de una competencia: DataFrame con una fila por fecha y una columna por
+        categoría (porcentaje de usuarios).
+        """
+        with self._lock:
+            tabla = pd.read_sql_query(
+                "SELECT fecha, categoria, porcentaje FROM distribuciones"
+                " WHERE course_id = ? AND competencia = ? AND criterio_id IS NULL ORDER BY fecha",
+                self._conn, params=(str(course_id), competencia),
+            )
+        return tabla.pivot(index="fecha", columns="categoria", values="porcentaje").reindex(columns=CATEGORIAS)
+
+def _porcentaje(celda):
+    """'12.5%' -> 12.5"""
+    return float(str(celda["Porcentaje"]).rstrip("%"))
+
+def outcome_result_key(item, page, position):
+    """Id estable de un outcome_result (o su posición si Canvas no lo informa)."""
+    result_id = item.get("id")
+    return str(result_id) if result_id is not None else f"{page}:{position}"
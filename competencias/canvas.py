@@ -0,0 +1,520 @@
+"""
+Descarga de datos desde la API de Canvas: paginación, outcome_results,
+árboles de competencias, cursos, tareas y usuarios.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from urllib.parse import parse_qs, urlparse
+import threading
+
+import pandas as pd
+import requests
+
+from .cache import outcome_result_key
+from .client import CanvasClient
+from .config import MAX_WORKERS, USER_NAMES_CACHE_SIZE
+from .metrics import propagar
+
+def _page_number(url):
+    """
+    Extrae el número de página (?page=N) de una URL de paginación de Canvas.
+    Devuelve None si la página no es numérica (p. ej. bookmarks).
+    """
+    page = parse_qs(urlparse(str(url)).query).get("page", [None])[0]
+    if page is not None and str(page).isdigit():
+        return int(page)
+    return None
+
+def _page_items(data, key=None):
+    """
+    Normaliza el cuerpo de una página: Canvas a veces devuelve una lista y otras
+    un dict que envuelve la lista bajo 'key' (p. ej. 'outcome_results').
+    """
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict) and key:
+        return data.get(key, [])
+    return []
+
+def _url_paginada(client, path):
+    """URL absoluta de un listado con per_page=100; falta agregarle '&page=N'."""
+    separator = "&" if "?" in path else "?"
+    return client.url(f"{path}{separator}per_page=100")
+
+def iter_pages(client, path, max_workers=MAX_WORKERS):
+    """
+    Recorre TODAS las páginas de un listado de Canvas y entrega el JSON de cada una, en orden.
+    Pide la primera página, lee el header 'Link' (rel="last") para saber cuántas
+    páginas hay y descarga el resto en paralelo con un pool acotado de hilos, con a lo
+    más 2*max_workers páginas pedidas a la vez: la memoria no crece con el total de páginas.
+    Si Canvas no informa la última página, sigue los enlaces rel="next" uno a uno.
+    Lanza HTTPError si alguna página falla.
+    """
+    url = _url_paginada(client, path)
+
+    def fetch_page(page_url):
+        response = client.get(page_url)
+        response.raise_for_status()
+        return response
+
+    first = fetch_page(f"{url}&page=1")
+    yield first.json()
+    last_page = _last_page(first)
+
+    if last_page is not None:
+        # 1) Conocemos el total de páginas: descargamos 2..N en paralelo, en una ventana acotada
+        if last_page > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                fetch_page_en_hilo = propagar(fetch_page)
+                siguientes = iter(range(2, last_page + 1))
+                pendientes = deque(executor.submit(fetch_page_en_hilo, f"{url}&page={page}")
+                                   for page in islice(siguientes, 2 * max_workers))
+                try:
+                    # Se consumen en orden de envío para conservar el orden de las páginas
+                    while pendientes:
+                        response = pendientes.popleft().result()
+                        for page in islice(siguientes, 1):
+                            pendientes.append(executor.submit(fetch_page_en_hilo, f"{url}&page={page}"))
+                        yield response.json()
+                finally:
+                    for future in pendientes:
+                        future.cancel()
+    else:
+        # 2) Sin rel="last": seguimos rel="next" secuencialmente
+        response = first
+        while "next" in response.links:
+            response = fetch_page(response.links["next"]["url"])
+            yield response.json()
+
+def fetch_paginated(client, path, key=None, max_workers=MAX_WORKERS, on_page=None):
+    """
+    Descarga TODAS las páginas de un listado de Canvas (ver iter_pages).
+    'on_page(data)' recibe el JSON completo de cada página, en orden (p. ej. para leer 'linked').
+    Devuelve los elementos en orden de página. Lanza HTTPError si alguna página falla.
+    """
+    items = []
+    for data in iter_pages(client, path, max_workers):
+        if on_page is not None:
+            on_page(data)
+        items.extend(_page_items(data, key))
+    return items
+
+def _error_de_resultados(error):
+    """RuntimeError para el usuario a partir del HTTPError de una página de outcome_results."""
+    page = _page_number(error.response.url) or 1
+    return RuntimeError(f"No se pudo obtener los datos en la página {page}. "
+                        f"Código de error: {error.response.status_code}. Contacta con el administrador.")
+
+def fetch_all_results(client, course_id, max_workers=MAX_WORKERS):
+    """
+    Obtiene TODOS los outcome_results de un curso (ver fetch_paginated).
+    Devuelve una lista con todos los 'outcome_results', en orden de página.
+    Lanza RuntimeError si falla alguna página.
+    """
+    try:
+        return fetch_paginated(client, f"courses/{course_id}/outcome_results",
+                               key='outcome_results', max_workers=max_workers)
+    except requests.exceptions.HTTPError as e:
+        raise _error_de_resultados(e) from e
+
+def acumular_outcome_results(client, course_id, acumulador, max_workers=MAX_WORKERS):
+    """
+    Descarga los outcome_results de un curso en streaming: cada página se entrega a
+    'acumulador.agregar(resultados)' y se descarta, sin juntar la lista completa
+    (ver aggregation.AcumuladorResultados). Devuelve el acumulador.
+    Lanza RuntimeError si falla alguna página.
+    """
+    try:
+        for data in iter_pages(client, f"courses/{course_id}/outcome_results", max_workers):
+            acumulador.agregar(_page_items(data, "outcome_results"))
+    except requests.exceptions.HTTPError as e:
+        raise _error_de_resultados(e) from e
+    return acumulador
+
+def _last_page(response):
+    """Número de la última página según el header 'Link' (rel="last"), o None."""
+    return _page_number(response.links.get("last", {}).get("url", ""))
+
+def _check_results_page(response, page):
+    """Acepta 200 y 304 (página sin cambios); cualquier otro código lanza RuntimeError."""
+    if response.status_code not in (200, 304):
+        raise RuntimeError(f"No se pudo obtener los datos en la página {page}. "
+                           f"Código de error: {response.status_code}. Contacta con el administrador.")
+    return response
+
+def _guardar_sincronizacion(client, store, course_id, responses, last_page):
+    """
+    Guarda en 'store' las páginas de outcome_results que cambiaron ({página: Response},
+    todas descargadas en esta sincronización) y cuenta las novedades.
+    Devuelve (resultados, cantidad_de_novedades).
+    """
+    scope = client.cache_scope
+    known = store.assessed_at(scope, course_id)
+    changed_pages = {}
+    novedades = 0
+    for page, response in responses.items():
+        if response.status_code == 304 or page > last_page:
+            continue
+        items = response.json().get('outcome_results', [])
+        changed_pages[page] = (response.headers.get("ETag"), items)
+        for pos, item in enumerate(items):
+            result_id = outcome_result_key(item, page, pos)
+            assessed_at = item.get("submitted_or_assessed_at")
+            if result_id not in known or (assessed_at or "") > (known[result_id] or ""):
+                novedades += 1
+
+    store.save(scope, course_id, changed_pages, last_page)
+    return store.results(scope, course_id), novedades
+
+def sync_outcome_results(client, store, course_id, max_workers=MAX_WORKERS):
+    """
+    Sincroniza de forma incremental los outcome_results de un curso con la copia local.
+    Canvas no permite filtrar outcome_results por fecha, así que cada página ya guardada
+    se pide con If-None-Match: las que no cambiaron responden 304 y se reutilizan desde
+    'store'; de las que cambiaron solo se cuentan como novedades los resultados nuevos o
+    con 'submitted_or_assessed_at' posterior a lo guardado.
+
+    Un 304 no dice cuántas páginas hay ahora, así que la última página guardada se pide
+    siempre completa: su header 'Link' trae el total actualizado (o rel="next" si
+    aparecieron páginas nuevas), y las páginas que falten se descargan a continuación.
+
+    Devuelve (resultados, cantidad_de_novedades). Si falla alguna página lanza
+    RuntimeError sin tocar la copia local.
+    """
+    url = _url_paginada(client, f"courses/{course_id}/outcome_results")
+    known_last_page, etags = store.state(client.cache_scope, course_id)
+
+    def fetch_page(page, page_url=None, revalidar=True):
+        etag = etags.get(page) if revalidar else None
+        response = client.get(page_url or f"{url}&page={page}",
+                              headers={"If-None-Match": etag} if etag else None)
+        return _check_results_page(response, page)
+
+    # Páginas ya conocidas: todas con ETag salvo la última, que da el total de páginas
+    probe = known_last_page or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = range(1, probe)
+        f_probe = executor.submit(propagar(fetch_page), probe, None, False)
+        responses = dict(zip(pages, executor.map(propagar(fetch_page), pages)))
+        responses[probe] = f_probe.result()
+
+        last_page = _last_page(responses[probe])
+        if last_page is not None:
+            pages = range(probe + 1, last_page + 1)
+            responses.update(zip(pages, executor.map(propagar(fetch_page), pages)))
+
+    if last_page is None:
+        # Sin rel="last": seguimos rel="next" secuencialmente desde la última página conocida
+        response, last_page = responses[probe], probe
+        while "next" in response.links:
+            last_page += 1
+            response = responses[last_page] = fetch_page(last_page, response.links["next"]["url"])
+
+    return _guardar_sincronizacion(client, store, course_id, responses, last_page)
+
+def fetch_outcome_rollups(client, course_id, max_workers=MAX_WORKERS):
+    """
+    Obtiene los puntajes ya agregados por Canvas para cada usuario y outcome
+    (/outcome_rollups), junto con los outcomes referenciados.
+    Devuelve (rollups, {outcome_id: outcome}). Lanza HTTPError si alguna página falla.
+    """
+    outcomes = {}
+    rollups = fetch_paginated(client, f"courses/{course_id}/outcome_rollups?include[]=outcomes",
+                              key="rollups", max_workers=max_workers, on_page=_leer_linked(outcomes))
+    return rollups, outcomes
+
+def _leer_linked(outcomes):
+    """on_page que junta en 'outcomes' ({outcome_id: outcome}) los outcomes de 'linked' de cada página."""
+    def leer_linked(data):
+        for outcome in data.get("linked", {}).get("outcomes", []):
+            outcomes[str(outcome.get("id"))] = outcome
+    return leer_linked
+
+def get_outcome_groups(course_id, client):
+    """
+    Obtiene los grupos de competencias (Outcome Groups) de un curso, todas las páginas
+    (Canvas entrega 10 por página si no se pide otra cosa). Devuelve una lista.
+    """
+    return fetch_paginated(client, f"courses/{course_id}/outcome_groups")
+
+def get_subgroups(course_id, group_id, client):
+    """
+    Retorna los subgrupos de un grupo específico (todas las páginas).
+    """
+    return fetch_paginated(client, f"courses/{course_id}/outcome_groups/{group_id}/subgroups",
+                           key="outcome_groups")
+
+def get_outcomes_in_group(course_id, group_id, client):
+    """
+    Retorna la lista de 'relaciones' entre un grupo de competencias y sus Outcomes
+    (todas las páginas). Cada elemento suele tener la forma:
+    {
+      "outcome": {"id": 123, "title": "..."},
+      ...
+    }
+    """
+    return fetch_paginated(client, f"courses/{course_id}/outcome_groups/{group_id}/outcomes")
+
+def _fetch_group_node(course_id, group_id, client, filtro_subgrupos=None):
+    """
+    Descarga un nodo del árbol: sus outcomes como pares (id, título) y los ids de sus subgrupos.
+    """
+    return _nodo_del_grupo(get_outcomes_in_group(course_id, group_id, client),
+                           get_subgroups(course_id, group_id, client), filtro_subgrupos)
+
+def _nodo_del_grupo(outcome_links, subgroups, filtro_subgrupos=None):
+    """
+    Convierte los listados de un grupo en (outcomes como pares (id, título), ids de subgrupos).
+    Con 'filtro_subgrupos' (regex compilada) solo quedan los subgrupos cuyo título calza.
+    """
+    outcomes = []
+    for item in outcome_links:
+        outcome_data = item.get("outcome", {})
+        oid = outcome_data.get("id")
+        otitle = outcome_data.get("title", f"Outcome {oid}")
+        if oid:
+            outcomes.append((oid, otitle))
+
+    children = [sg.get("id") for sg in subgroups
+                if sg.get("id") and (filtro_subgrupos is None or filtro_subgrupos.match(sg.get("title", "").strip()))]
+    return outcomes, children
+
+def gather_outcomes_for_groups(course_id, group_ids, client, max_workers=MAX_WORKERS, filtro_subgrupos=None):
+    """
+    Recolecta TODOS los outcomes (competencias) que vivan en cada grupo raíz y en sus subgrupos.
+    Recorre el árbol por niveles (BFS): todos los nodos de un mismo nivel, de todos los
+    grupos raíz, se descargan en paralelo. Con 'filtro_subgrupos' (regex compilada), los
+    subgrupos cuyo título no calza se podan: ni ellos ni su subárbol se descargan.
+
+    Devuelve {group_id: [(outcome_id, outcome_title), ...]} en el mismo orden que un
+    recorrido en profundidad (outcomes del grupo y luego cada subgrupo, recursivamente).
+    """
+    nodes = {}  # group_id -> (outcomes, children)
+    level = list(dict.fromkeys(group_ids))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while level:
+            fetched = executor.map(
+                propagar(lambda gid: _fetch_group_node(course_id, gid, client, filtro_subgrupos)), level)
+            level = _siguiente_nivel(nodes, level, fetched)
+
+    return _aplanar_arbol(nodes, group_ids)
+
+def _siguiente_nivel(nodes, level, fetched):
+    """
+    Guarda en 'nodes' los nodos ya descargados de un nivel (en el mismo orden que 'level')
+    y devuelve los ids del nivel siguiente, sin repetir ni volver a nodos conocidos.
+    """
+    next_level = []
+    for gid, node in zip(level, fetched):
+        nodes[gid] = node
+        for child in node[1]:
+            if child not in nodes and child not in next_level:
+                next_level.append(child)
+    return [gid for gid in next_level if gid not in nodes]
+
+def _aplanar_arbol(nodes, group_ids):
+    """
+    A partir de {group_id: (outcomes, children)} devuelve {group_id: [(outcome_id, outcome_title), ...]}
+    en el orden de un recorrido en profundidad.
+    """
+    def flatten(gid, path):
+        outcomes, children = nodes[gid]
+        results = list(outcomes)
+        for child in children:
+            if child not in path:  # Evita ciclos en árboles mal formados
+                results.extend(flatten(child, path | {child}))
+        return results
+
+    return {gid: flatten(gid, {gid}) for gid in group_ids}
+
+def gather_outcomes_with_titles(course_id, group_id, client):
+    """
+    Recolecta (en una lista) TODOS los outcomes (competencias) que vivan en
+    este grupo y en sus subgrupos.
+
+    Devuelve pares (outcome_id, outcome_title).
+    """
+    return gather_outcomes_for_groups(course_id, [group_id], client)[group_id]
+
+def get_course_details(course_id, client):
+    """
+    Obtiene detalles básicos del curso (nombre, sis_course_id, subcuenta).
+    No es estrictamente necesario para el cálculo, pero se usa para mostrar info.
+    """
+    course_data = client.get_json(f"courses/{course_id}")
+    account_resp = client.get(f"accounts/{course_data.get('account_id', '')}")
+    return _datos_del_curso(course_id, course_data, account_resp)
+
+def _datos_del_curso(course_id, course_data, account_resp):
+    """Arma el dict de get_course_details a partir del curso y la respuesta de su subcuenta."""
+    if account_resp.status_code == 200:
+        account_data = account_resp.json()
+        subaccount_name = account_data.get("name", "")
+    else:
+        subaccount_name = ""
+
+    return {
+        "course_name": course_data.get("name", f"Curso {course_id}"),
+        "sis_course_id": course_data.get("sis_course_id"),
+        "course_code": course_data.get("course_code"),
+        "subaccount_name": subaccount_name
+    }
+
+def get_assignments_with_weights(course_id: int, client: CanvasClient) -> list:
+    """
+    Obtiene las tareas de un curso y su ponderación total.
+    Los grupos de asignación y las tareas se descargan a la vez (cada listado con
+    sus páginas en paralelo, ver fetch_paginated).
+
+    Parámetros:
+    -----------
+    - course_id: int
+        El ID interno del curso en Canvas.
+    - client: CanvasClient
+        Cliente compartido de la API de Canvas (URL base, token y pool de conexiones).
+
+    Retorna:
+    --------
+    - list of dict:
+        [
+            {
+                "Tarea": "Nombre de la Tarea",
+                "Ponderación": "20.0%"
+            },
+            ...
+        ]
+
+    Lanza RuntimeError (con un mensaje para el usuario) si falla alguna descarga.
+    """
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            f_grupos = executor.submit(propagar(fetch_paginated), client, f"courses/{course_id}/assignment_groups")
+            f_tareas = executor.submit(propagar(fetch_paginated), client, f"courses/{course_id}/assignments")
+            assignment_groups, assignments = f_grupos.result(), f_tareas.result()
+    except requests.exceptions.RequestException as e:
+        raise _error_de_tareas(e) from e
+    return _ponderar_tareas(assignment_groups, assignments)
+
+def _error_de_tareas(error):
+    """RuntimeError para el usuario a partir del error de descarga de las tareas."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        return RuntimeError(f"No se pudieron obtener las tareas del curso (página {_page_number(error.response.url) or 1}). "
+                            f"Código de error: {error.response.status_code}.")
+    return RuntimeError(f"No se pudieron obtener las tareas del curso: {error}")
+
+def _ponderar_tareas(assignment_groups, assignments):
+    """
+    Reparte el 'group_weight' de cada grupo de asignación en partes iguales entre sus
+    tareas. Las tareas sin un grupo de asignación válido valen 0%.
+    Devuelve la lista de get_assignments_with_weights.
+    """
+    # Usar 'group_weight' en lugar de 'computed_weight'
+    group_weights = {g["id"]: g.get("group_weight", 0) for g in assignment_groups if g.get("id") is not None}
+    tareas = pd.DataFrame({
+        "Tarea": [a.get("name", "Sin nombre") for a in assignments],
+        "grupo": [a.get("assignment_group_id") for a in assignments],
+    })
+    tareas.loc[~tareas["grupo"].isin(list(group_weights)), "grupo"] = None
+
+    # Peso del grupo dividido por la cantidad de tareas del grupo (NaN -> 0% fuera de un grupo válido)
+    cantidad = tareas.groupby("grupo")["Tarea"].transform("size")
+    ponderacion = (pd.to_numeric(tareas["grupo"].map(group_weights), errors="coerce") / cantidad).fillna(0.0)
+    return [{"Tarea": name, "Ponderación": f"{weight:.1f}%"} for name, weight in zip(tareas["Tarea"], ponderacion)]
+
+class _NombresUsuarios:
+    """
+    Caché LRU acotada de id -> nombre de usuario, compartida entre cursos y entre hilos.
+    """
+
+    def __init__(self, maxsize=USER_NAMES_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._nombres = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._nombres:
+                return None
+            self._nombres.move_to_end(key)
+            return self._nombres[key]
+
+    def put(self, key, name):
+        with self._lock:
+            self._nombres[key] = name
+            self._nombres.move_to_end(key)
+            while len(self._nombres) > self.maxsize:
+                self._nombres.popitem(last=False)
+
+_nombres_usuarios = _NombresUsuarios()
+
+def _get_user_name(user_id, client):
+    """Pide un usuario puntual (GET /users/:id). Devuelve (nombre, se_puede_cachear)."""
+    try:
+        return _nombre_de_usuario(client.get(f"users/{user_id}"))
+    except requests.exceptions.RequestException as e:
+        return f"Error: {e}", False
+
+def _nombre_de_usuario(response):
+    """(nombre, se_puede_cachear) a partir de la respuesta de GET /users/:id."""
+    if response.status_code == 200:
+        return response.json().get("name", "Sin nombre"), True
+    return f"Error {response.status_code}", False
+
+def _nombres_en_cache(client, user_ids):
+    """
+    Busca los user_ids en la caché LRU compartida.
+    Devuelve ({user_id: nombre} de los que ya están, [user_id faltantes sin repetir]).
+    """
+    nombres = {}
+    for user_id in user_ids:
+        name = _nombres_usuarios.get((client.base_url, str(user_id)))
+        if name is not None:
+            nombres[str(user_id)] = name
+    return nombres, [uid for uid in dict.fromkeys(str(u) for u in user_ids) if uid not in nombres]
+
+def _guardar_nombres(client, nombres, usuarios):
+    """Suma a 'nombres' (y a la caché LRU) los usuarios de un listado GET /courses/:id/users."""
+    for user in usuarios:
+        uid = str(user.get("id"))
+        name = user.get("name", "Sin nombre")
+        _nombres_usuarios.put((client.base_url, uid), name)
+        nombres[uid] = name
+
+def get_user_details(user_ids, client, course_id=None, max_workers=MAX_WORKERS):
+    """
+    Obtiene los detalles de los usuarios dado una lista de user_ids.
+    Primero usa la caché LRU compartida; si se indica course_id, trae a todos los
+    usuarios del curso en un solo listado paginado (páginas en paralelo) y solo los
+    que aún falten se piden uno a uno, también en paralelo.
+    Retorna una lista de dicts con 'user_id' y 'name', en el orden recibido.
+    """
+    nombres, faltantes = _nombres_en_cache(client, user_ids)
+    if faltantes and course_id is not None:
+        try:
+            _guardar_nombres(client, nombres, fetch_paginated(client, f"courses/{course_id}/users",
+                                                              max_workers=max_workers))
+        except requests.exceptions.HTTPError:
+            pass  # Sin permiso para listar el curso: se piden uno a uno
+        faltantes = [uid for uid in faltantes if uid not in nombres]
+
+    if faltantes:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for uid, (name, cacheable) in zip(faltantes, executor.map(propagar(lambda u: _get_user_name(u, client)), faltantes)):
+                if cacheable:
+                    _nombres_usuarios.put((client.base_url, uid), name)
+                nombres[uid] = name
+
+    return [{"user_id": user_id, "name": nombres[str(user_id)]} for user_id in user_ids]
+
+def get_account_course_ids(account_id, client, include_subaccounts=True):
+    """Lista los IDs de todos los cursos de una subcuenta (todas las páginas)."""
+    return [str(c["id"]) for c in fetch_paginated(client, _ruta_cursos_de_cuenta(account_id, include_subaccounts))
+            if c.get("id")]
+
+def _ruta_cursos_de_cuenta(account_id, include_subaccounts=True):
+    path = f"accounts/{account_id}/courses"
+    if include_subaccounts:
+        path += "?include_subaccounts=true"
+    return path
@@ -0,0 +1,230 @@
+"""
+Línea de comandos, sin Streamlit. Ejemplos:
+
+    python -m competencias report --course 123
+    python -m competencias report --course 123 --course 456 --details --format json
+    python -m competencias report --account 42 --format parquet --output competencias.parquet
+    python -m competencias snapshot --course 123 --course 456   # p. ej. desde cron, cada noche
+    python -m competencias bench --students 500 --depth 2 --latency 0.02
+"""
+import argparse
+import json
+import re
+import sys
+
+import pandas as pd
+import requests
+
+from .aggregation import UMBRALES, validar_umbrales
+from .cache import CanvasCache, ResultsStore, SnapshotStore
+from .canvas import get_account_course_ids
+from .client import CanvasClient
+from .config import (
+    BATCH_WORKERS,
+    CACHE_PATH,
+    CANVAS_BASE_URL,
+    GRUPOS_COMPETENCIA,
+    SNAPSHOT_COURSES,
+    SNAPSHOTS_PATH,
+    SUBGRUPOS_COMPETENCIA,
+    get_token,
+)
+from .metrics import Metricas, activar_log, etapa, instrumentar, log_json
+from .report import (
+    FUENTE_RESULTADOS,
+    FUENTE_ROLLUPS,
+    FUENTES,
+    compilar_filtro_grupos,
+    leer_ids_de_csv,
+    leer_ids_de_cursos,
+    procesar_cursos,
+    tabla_combinada,
+)
+
+FORMATOS = ("csv", "json", "parquet")
+FORMATOS_METRICAS = ("json", "prometheus")
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="competencias", description="Promediador de competencias por curso.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report = commands.add_parser("report", help="Calcula la distribución de competencias de uno o más cursos.")
+    add_course_arguments(report)
+    report.add_argument("--details", action="store_true", help="Incluye una fila por cada criterio.")
+    report.add_argument("--source", choices=FUENTES, default=FUENTE_RESULTADOS,
+                        help="'rollups' usa los promedios agregados por Canvas (más rápido, sin --details); "
+                             "'streaming' suma los resultados página por página con memoria acotada "
+                             "(recomendado para subcuentas grandes).")
+    report.add_argument("--format", choices=FORMATOS, default="csv")
+    report.add_argument("--output", "-o", metavar="ARCHIVO", help="Archivo de salida (por defecto, stdout).")
+    add_run_arguments(report)
+
+    snapshot = commands.add_parser("snapshot", help="Calcula y guarda instantáneas para que la app las lea "
+                                                    "sin consultar Canvas (sin cursos, usa SNAPSHOT_COURSES).")
+    add_course_arguments(snapshot)
+    snapshot.add_argument("--source", choices=FUENTES, default=FUENTE_RESULTADOS,
+                          help="Fuente de los promedios (ver report --source).")
+    snapshot.add_argument("--snapshots-path", default=SNAPSHOTS_PATH)
+    add_run_arguments(snapshot)
+
+    bench = commands.add_parser("bench", help="Mide cada etapa contra un Canvas falso local con un curso sintético.")
+    bench.add_argument("--students", type=int, default=200, help="Estudiantes del curso.")
+    bench.add_argument("--competencies", type=int, default=3, help="Grupos raíz de competencias.")
+    bench.add_argument("--outcomes", type=int, default=3, help="Criterios (outcomes) por cada nodo del árbol.")
+    bench.add_argument("--depth", type=int, default=1, help="Niveles de subgrupos bajo cada competencia.")
+    bench.add_argument("--branches", type=int, default=2, help="Subgrupos por nodo.")
+    bench.add_argument("--latency", type=float, default=0.0, help="Segundos de latencia por petición.")
+    bench.add_argument("--workers", type=int, help="Descargas simultáneas (por defecto, MAX_WORKERS).")
+    bench.add_argument("--no-memory", action="store_true", help="No mide memoria (tracemalloc agrega overhead).")
+    bench.add_argument("--json", action="store_true", help="Imprime las filas como JSON.")
+    return parser
+
+def add_course_arguments(parser):
+    """Opciones para elegir los cursos a procesar (ver select_courses)."""
+    parser.add_argument("--course", action="append", default=[], metavar="ID",
+                        help="ID de curso (se puede repetir o separar por comas).")
+    parser.add_argument("--courses-csv", metavar="ARCHIVO", help="CSV con una columna de IDs de curso.")
+    parser.add_argument("--account", metavar="ID", help="Procesa todos los cursos de esta subcuenta.")
+    parser.add_argument("--no-subaccounts", action="store_true",
+                        help="Con --account, no incluye los cursos de subcuentas hijas.")
+
+def add_run_arguments(parser):
+    parser.add_argument("--refresh", action="store_true", help="Ignora la caché local y revalida todo.")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="Cursos procesados a la vez.")
+    parser.add_argument("--base-url", default=CANVAS_BASE_URL)
+    parser.add_argument("--cache-path", default=CACHE_PATH)
+    parser.add_argument("--metrics", choices=FORMATOS_METRICAS,
+                        help="Métricas por etapa (tiempo, peticiones, bytes, reintentos, caché) en stderr. "
+                             "La línea JSON sale siempre; 'prometheus' agrega el formato de exposición.")
+    parser.add_argument("--groups", type=regex_argument, default=GRUPOS_COMPETENCIA, metavar="REGEX",
+                        help="Grupos raíz que son competencias: regex que calza con el inicio del título "
+                             "(por defecto, GRUPOS_COMPETENCIA).")
+    parser.add_argument("--subgroups", type=regex_argument, default=SUBGRUPOS_COMPETENCIA or None, metavar="REGEX",
+                        help="Solo recorre los subgrupos cuyo título calza (por defecto, SUBGRUPOS_COMPETENCIA; "
+                             "sin valor, todos).")
+    parser.add_argument("--thresholds", type=thresholds_argument, default=UMBRALES, metavar="A,B,C",
+                        help="Límites inferiores (0..1) de las categorías de dominio (por defecto, UMBRALES).")
+
+def regex_argument(valor):
+    try:
+        return compilar_filtro_grupos(valor)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"regex inválida: {e}")
+
+def thresholds_argument(valor):
+    try:
+        return validar_umbrales(valor.split(","))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def write_table(tabla, formato, output):
+    """Escribe la tabla en el formato pedido, a un archivo o a stdout."""
+    if formato == "parquet":
+        if not output:
+            raise SystemExit("El formato parquet requiere --output.")
+        try:
+            tabla.to_parquet(output, index=False)
+        except ImportError as e:
+            raise SystemExit(f"El formato parquet requiere pyarrow: {e}")
+    elif formato == "json":
+        tabla.to_json(output or sys.stdout, orient="records", force_ascii=False, indent=2)
+    else:
+        tabla.to_csv(output or sys.stdout, index=False)
+
+def open_client(args):
+    token = get_token()
+    if not token:
+        raise SystemExit("Falta la variable TOKEN con el token de la API de Canvas.")
+    return CanvasClient(args.base_url, token, cache=CanvasCache(args.cache_path)), ResultsStore(args.cache_path)
+
+def select_courses(args, client, store, default=""):
+    """
+    IDs de curso pedidos (sin repetir); si no se indicó ninguna opción, los de 'default'.
+    Con --refresh, vence la caché de esos cursos.
+    """
+    course_ids = leer_ids_de_cursos(" ".join(args.course))
+    if args.courses_csv:
+        course_ids += leer_ids_de_csv(args.courses_csv)
+    if args.account:
+        try:
+            course_ids += get_account_course_ids(args.account, client, not args.no_subaccounts)
+        except requests.exceptions.RequestException as e:
+            print(f"No se pudieron listar los cursos de la subcuenta {args.account}: {e}", file=sys.stderr)
+    if not (args.course or args.courses_csv or args.account):
+        course_ids = leer_ids_de_cursos(default)
+    course_ids = list(dict.fromkeys(course_ids))
+    if not course_ids:
+        raise SystemExit("Indica al menos un curso con --course, --courses-csv o --account.")
+
+    if args.refresh:
+        client.expire_cache()
+        for cid in course_ids:
+            store.reset(client.cache_scope, cid)
+    return course_ids
+
+def progress(hechos, total, cid, error):
+    estado = f"error: {error}" if error else "ok"
+    print(f"[{hechos}/{total}] curso {cid}: {estado}", file=sys.stderr)
+
+def write_metrics(metricas, formato, **contexto):
+    """La línea JSON del logger de métricas siempre sale por stderr (ver activar_log); prometheus se agrega aparte."""
+    log_json(metricas, **contexto)
+    if formato == "prometheus":
+        print(metricas.a_prometheus(), end="", file=sys.stderr)
+
+def run_report(args):
+    client, store = open_client(args)
+    course_ids = select_courses(args, client, store)
+
+    # El detalle por criterio siempre sale de los resultados individuales
+    fuente = FUENTE_RESULTADOS if args.details and args.source == FUENTE_ROLLUPS else args.source
+    with instrumentar(Metricas()) as metricas:
+        resumenes, errores = procesar_cursos(client, store, course_ids, max_workers=args.workers,
+                                             on_progress=progress, fuente=fuente, filtro=args.groups,
+                                             filtro_subgrupos=args.subgroups, umbrales=args.thresholds)
+        with etapa("salida"):
+            write_table(tabla_combinada(resumenes, incluir_criterios=args.details), args.format, args.output)
+
+    write_metrics(metricas, args.metrics, comando="report", cursos=len(course_ids), errores=len(errores))
+    return 0 if resumenes else 1
+
+def run_snapshot(args):
+    client, store = open_client(args)
+    course_ids = select_courses(args, client, store, default=SNAPSHOT_COURSES)
+    snapshots = SnapshotStore(args.snapshots_path)
+
+    with instrumentar(Metricas()) as metricas:
+        resumenes, errores = procesar_cursos(client, store, course_ids, max_workers=args.workers,
+                                             on_progress=progress, fuente=args.source, filtro=args.groups,
+                                             filtro_subgrupos=args.subgroups, umbrales=args.thresholds)
+        with etapa("salida"):
+            for cid, resumen in resumenes:
+                snapshots.save(cid, resumen)
+
+    print(f"{len(resumenes)} instantáneas guardadas en {args.snapshots_path}", file=sys.stderr)
+    write_metrics(metricas, args.metrics, comando="snapshot", cursos=len(course_ids), errores=len(errores))
+    return 0 if resumenes else 1
+
+def run_bench(args):
+    from .bench import run_benchmark
+
+    filas = run_benchmark(estudiantes=args.students, competencias=args.competencies, criterios=args.outcomes,
+                          profundidad=args.depth, ramas=args.branches, latencia=args.latency,
+                          max_workers=args.workers, memoria=not args.no_memory)
+    if args.json:
+        json.dump(filas, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print(pd.DataFrame(filas).to_string(index=False))
+    return 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    activar_log()
+    if args.command == "report":
+        return run_report(args)
+    if args.command == "snapshot":
+        return run_snapshot(args)
+    if args.command == "bench":
+        return run_bench(args)
+    return 2
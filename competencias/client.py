@@ -0,0 +1,172 @@
+"""
+Cliente HTTP para la API de Canvas.
+"""
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import CanvasCache
+from .config import MAX_WORKERS
+from .metrics import registrar_cache, registrar_peticion
+
+class _CanvasBase:
+    """Lo común a CanvasClient y aio.AsyncCanvasClient: URLs y política de reintentos."""
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def url(self, path):
+        """Devuelve la URL absoluta para un path relativo a la API (o la misma URL si ya es absoluta)."""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _url_con_params(self, path, params=None):
+        """URL absoluta con 'params' en la query, codificada igual en ambos clientes (es la clave de la caché)."""
+        return requests.Request("GET", self.url(path), params=params).prepare().url
+
+    def _should_retry(self, response):
+        if response.status_code in self.RETRY_STATUS:
+            return True
+        # Canvas responde 403 con "Rate Limit Exceeded" cuando se agota la cuota
+        return response.status_code == 403 and "rate limit" in response.text.lower()
+
+    def _delay(self, attempt, response=None):
+        """
+        Segundos a esperar antes de reintentar. 'Retry-After' es un mínimo: el jitter se suma
+        encima; sin él, backoff exponencial con jitter de ±50%.
+        """
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        try:
+            return float(retry_after) + random.uniform(0, self.backoff)
+        except (TypeError, ValueError):
+            return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+class CanvasClient(_CanvasBase):
+    """
+    Cliente HTTP compartido para la API de Canvas.
+    - Mantiene un pool de conexiones keep-alive (una sola sesión para toda la app).
+    - Reintenta con backoff exponencial + jitter ante 429, 403 por rate limit, 5xx y errores de red.
+    - Ajusta la cantidad de peticiones simultáneas según X-Rate-Limit-Remaining.
+    """
+    LOW_REMAINING = 200.0   # Bajo este saldo de cuota reducimos la concurrencia a la mitad
+    HIGH_REMAINING = 500.0  # Sobre este saldo la volvemos a subir de a uno
+
+    def __init__(self, base_url, token, max_workers=MAX_WORKERS, max_retries=5,
+                 backoff=0.5, timeout=30, cache=None):
+        self.base_url = base_url.rstrip("/")
+        self.cache = cache
+        self.cache_scope = CanvasCache.scope(token)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Control de concurrencia adaptativo
+        self._limit = max_workers
+        self._in_flight = 0
+        self._antes_del_recorte = 0  # Peticiones en vuelo al recortar el límite: no lo vuelven a tocar
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        with self._cond:
+            while self._in_flight >= self._limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def _release(self, response=None):
+        with self._cond:
+            self._in_flight -= 1
+            if self._antes_del_recorte:
+                # Su saldo de cuota ya estaba en vuelo cuando se recortó: es la misma ráfaga
+                self._antes_del_recorte -= 1
+            elif response is not None:
+                self._adapt(response.headers.get("X-Rate-Limit-Remaining"))
+            self._cond.notify_all()
+
+    def _adapt(self, remaining):
+        """
+        Ajusta el límite de concurrencia según la cuota restante que informa Canvas.
+        Se recorta a lo más una vez por ráfaga: las respuestas de las peticiones que ya
+        estaban en vuelo al recortar no vuelven a recortarlo (ver _release).
+        """
+        try:
+            remaining = float(remaining)
+        except (TypeError, ValueError):
+            return
+        if remaining < self.LOW_REMAINING:
+            self._limit = max(1, self._limit // 2)
+            self._antes_del_recorte = self._in_flight
+        elif remaining > self.HIGH_REMAINING and self._limit < self.max_workers:
+            self._limit += 1
+
+    def _sleep(self, attempt, response=None):
+        """Espera antes de reintentar (ver _delay)."""
+        time.sleep(self._delay(attempt, response))
+
+    def get(self, path, params=None, headers=None):
+        """
+        GET con caché y reintentos. Devuelve el último Response obtenido (aunque no sea 200).
+        Lanza requests.exceptions.RequestException si fallan todos los intentos por errores de red.
+        """
+        url = self._url_con_params(path, params)
+        if self.cache is None or self.cache.ttl_for(url) is None:
+            response = self._get(url, headers)
+            if response.status_code == 304:
+                registrar_cache()  # El llamador ya tiene una copia (p. ej. ResultsStore)
+            return response
+
+        cached = self.cache.lookup(self.cache_scope, url)
+        if cached is None:
+            response = self._get(url)
+        else:
+            cached_response, etag, fresh = cached
+            if fresh:
+                registrar_cache()
+                return cached_response
+            response = self._get(url, {"If-None-Match": etag} if etag else None)
+            if response.status_code == 304:
+                self.cache.touch(self.cache_scope, url)
+                registrar_cache()
+                return cached_response
+
+        if response.status_code == 200:
+            self.cache.store(self.cache_scope, url, response)
+        return response
+
+    def expire_cache(self):
+        """Obliga a revalidar (vía ETag) todo lo cacheado para este token."""
+        if self.cache is not None:
+            self.cache.expire(self.cache_scope)
+
+    def _get(self, url, headers=None):
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            response = None
+            try:
+                response = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            finally:
+                self._release(response)
+                registrar_peticion(len(response.content) if response is not None else 0, reintento=attempt > 0)
+
+            if response is not None and not self._should_retry(response):
+                return response
+            if attempt < self.max_retries:
+                self._sleep(attempt, response)
+        return response
+
+    def get_json(self, path, params=None):
+        """GET que lanza HTTPError si la respuesta no es exitosa y devuelve el JSON."""
+        response = self.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,32 @@
+"""
+Configuración compartida (variables de entorno vía .env / python-decouple).
+"""
+from decouple import Csv, config
+
+CANVAS_BASE_URL = config("CANVAS_BASE_URL", default="https://canvas.uautonoma.cl/api/v1")
+MAX_WORKERS = 8  # Máximo de descargas simultáneas contra la API de Canvas
+BATCH_WORKERS = 4  # Máximo de cursos procesados a la vez en el modo de varios cursos
+CACHE_PATH = config("CACHE_PATH", default=".canvas_cache.sqlite")  # Caché local de la estructura de cursos
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+SNAPSHOTS_PATH = config("SNAPSHOTS_PATH", default=".competencias_snapshots.sqlite")  # Instantáneas precalculadas
+SNAPSHOT_COURSES = config("SNAPSHOT_COURSES", default="")  # Cursos que recalcula la tarea programada
+# Grupos raíz que cuentan como competencias: expresión regular que debe calzar con el inicio
+# del título (sin distinguir mayúsculas). Una lista de prefijos se escribe como "cd|cp|cg".
+GRUPOS_COMPETENCIA = config("GRUPOS_COMPETENCIA", default="cd|cp|cg")
+# Subgrupos que se recorren dentro de cada competencia (mismo formato). Los que no calzan se
+# descartan junto con todo lo que tengan debajo, sin descargarlos. Vacío: se recorren todos.
+SUBGRUPOS_COMPETENCIA = config("SUBGRUPOS_COMPETENCIA", default="")
+# Límites inferiores (0..1) de las categorías de dominio, de la más alta a la más baja
+UMBRALES = config("UMBRALES", default="0.90,0.60,0.40", cast=Csv(float))
+USER_NAMES_CACHE_SIZE = 50_000  # Nombres de usuario recordados en memoria (LRU)
+
+# TTL (segundos) por tipo de recurso. Lo que no calce con ningún patrón no se guarda en caché.
+CACHE_TTLS = [
+    (r"/courses/\d+/outcome_groups", 24 * 3600),  # Árboles de competencias (y sus outcomes/subgrupos)
+    (r"/courses/\d+$", 12 * 3600),                # Detalles del curso
+    (r"/accounts/\d+$", 7 * 24 * 3600),           # Nombre de la subcuenta
+]
+
+def get_token():
+    """Token de la API de Canvas (variable TOKEN). Devuelve '' si no está configurado."""
+    return config("TOKEN", default="")
@@ -0,0 +1,257 @@
+"""
+Servidor local que imita la API de Canvas con cursos sintéticos, para pruebas y benchmarks
+sin tocar la instancia real. Solo usa la biblioteca estándar.
+
+    with FakeCanvas([CursoSintetico(1, estudiantes=300, profundidad=2)], latencia=0.02) as canvas:
+        client = CanvasClient(canvas.base_url, "token-falso")
+        procesar_curso(client, ResultsStore(":memory:"), "1")
+        print(canvas.peticiones)
+
+Implementa los endpoints que usa el paquete: cursos y subcuentas, outcome_groups (con
+subgrupos y outcomes), outcome_results (con ETag/304), outcome_rollups, usuarios y tareas.
+Todos los listados se paginan con el header 'Link' como Canvas.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+PREFIJOS = ("CD", "CP", "CG")
+
+class CursoSintetico:
+    """
+    Curso generado de forma determinista (misma 'semilla', mismos datos):
+    - 'competencias' grupos raíz compatibles (títulos CD/CP/CG) y uno que no lo es
+    - cada grupo es un árbol de 'profundidad' niveles con 'ramas' subgrupos por nodo
+      y 'criterios' outcomes en cada nodo
+    - cada estudiante tiene un resultado por outcome con probabilidad 'cobertura'
+    """
+
+    def __init__(self, course_id, estudiantes=100, competencias=3, criterios=3, profundidad=1,
+                 ramas=2, cobertura=1.0, tareas=20, account_id=1, semilla=0):
+        self.course_id = int(course_id)
+        self.account_id = account_id
+        rng = random.Random(f"{semilla}-{course_id}")
+        self._ids = iter(range(self.course_id * 1_000_000 + 1, (self.course_id + 1) * 1_000_000))
+
+        self.grupos = {}  # group_id -> {"title", "children", "outcomes"}
+        self.outcomes = {}  # outcome_id -> title
+        self.raices = []
+        for i in range(competencias):
+            titulo = f"{PREFIJOS[i % len(PREFIJOS)]}{i + 1} Competencia {i + 1}"
+            self.raices.append(self._crear_grupo(titulo, profundidad, ramas, criterios))
+        self.raices.append(self._crear_grupo("Otros aprendizajes", 0, 0, criterios))
+
+        self.usuarios = [next(self._ids) for _ in range(estudiantes)]
+        self.resultados = []
+        for user_id in self.usuarios:
+            for outcome_id in self.outcomes:
+                if rng.random() <= cobertura:
+                    self.resultados.append({
+                        "id": next(self._ids),
+                        "percent": round(rng.random(), 4),
+                        "submitted_or_assessed_at": f"2024-{rng.randint(3, 11):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+                        "links": {"user": str(user_id), "learning_outcome": str(outcome_id)},
+                    })
+
+        grupos_de_tareas = [next(self._ids) for _ in range(4)]
+        self.grupos_de_tareas = [{"id": gid, "name": f"Grupo {n + 1}", "group_weight": 25}
+                                 for n, gid in enumerate(grupos_de_tareas)]
+        self.tareas = [{"id": next(self._ids), "name": f"Tarea {n + 1}",
+                        "assignment_group_id": grupos_de_tareas[n % len(grupos_de_tareas)]}
+                       for n in range(tareas)]
+
+    def _crear_grupo(self, titulo, profundidad, ramas, criterios):
+        group_id = next(self._ids)
+        outcomes = []
+        for _ in range(criterios):
+            outcome_id = next(self._ids)
+            self.outcomes[outcome_id] = f"Criterio {outcome_id}"
+            outcomes.append(outcome_id)
+        self.grupos[group_id] = {"title": titulo, "children": [], "outcomes": outcomes}
+        if profundidad > 0:
+            self.grupos[group_id]["children"] = [
+                self._crear_grupo(f"{titulo} / {n + 1}", profundidad - 1, ramas, criterios) for n in range(ramas)
+            ]
+        return group_id
+
+    def rollups(self):
+        """Promedio por usuario y outcome, en el formato de /outcome_rollups (puntajes sobre 4)."""
+        acumulado = {}
+        for r in self.resultados:
+            clave = (r["links"]["user"], r["links"]["learning_outcome"])
+            suma, cantidad = acumulado.get(clave, (0.0, 0))
+            acumulado[clave] = (suma + r["percent"], cantidad + 1)
+        por_usuario = {}
+        for (user_id, outcome_id), (suma, cantidad) in acumulado.items():
+            por_usuario.setdefault(user_id, []).append(
+                {"score": 4 * suma / cantidad, "count": cantidad, "links": {"outcome": outcome_id}})
+        return [{"links": {"user": uid}, "scores": scores} for uid, scores in por_usuario.items()]
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        canvas = self.server.canvas
+        canvas._contar()
+        if canvas.latencia:
+            time.sleep(canvas.latencia)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = url.path[len(canvas.prefijo):] if url.path.startswith(canvas.prefijo) else url.path
+        try:
+            body, headers = canvas.responder(path.strip("/"), query)
+        except KeyError:
+            return self._enviar(404, {"errors": [{"message": "The specified resource does not exist."}]})
+
+        # Paginación estilo Canvas: el listado completo se recorta según page/per_page
+        if isinstance(body, _Listado):
+            body, headers = self._paginar(body, query, url.path)
+
+        data = json.dumps(body).encode()
+        etag = f'W/"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self._enviar(304, None, {"ETag": etag})
+        self._enviar(200, data, {**headers, "ETag": etag})
+
+    def _paginar(self, listado, query, path):
+        per_page = min(int(query.get("per_page", ["10"])[0]), 100)
+        page = int(query.get("page", ["1"])[0])
+        last = max(1, -(-len(listado.items) // per_page))
+        chunk = listado.items[(page - 1) * per_page:page * per_page]
+        body = {listado.key: chunk, **listado.extra} if listado.key else chunk
+
+        def link(n, rel):
+            params = {k: v[0] for k, v in query.items()}
+            params.update(page=n, per_page=per_page)
+            return f'<http://{self.headers.get("Host")}{path}?{urlencode(params)}>; rel="{rel}"'
+
+        links = [link(page, "current"), link(1, "first"), link(last, "last")]
+        if page < last:
+            links.insert(1, link(page + 1, "next"))
+        return body, {"Link": ",".join(links)}
+
+    def _enviar(self, status, data, headers=None):
+        if isinstance(data, dict):
+            data = json.dumps(data).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("X-Rate-Limit-Remaining", "700.0")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data or b"")))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+        self.server.canvas._contar_bytes(len(data or b""))
+
+class _Listado:
+    """Respuesta que se entrega paginada; 'key' envuelve la lista en un dict (p. ej. 'outcome_results')."""
+
+    def __init__(self, items, key=None, extra=None):
+        self.items = items
+        self.key = key
+        self.extra = extra or {}
+
+class FakeCanvas:
+    """
+    Servidor HTTP en un puerto libre de 127.0.0.1 que atiende los cursos entregados.
+    'latencia' (segundos) se suma a cada petición. 'peticiones' y 'bytes_enviados'
+    cuentan lo atendido desde el inicio (o desde reiniciar_contadores()).
+    """
+
+    def __init__(self, cursos, latencia=0.0, prefijo="/api/v1"):
+        self.cursos = {c.course_id: c for c in cursos}
+        self.latencia = latencia
+        self.prefijo = prefijo
+        self.peticiones = 0
+        self.bytes_enviados = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.prefijo}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.canvas = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.peticiones = 0
+            self.bytes_enviados = 0
+
+    def _contar(self):
+        with self._lock:
+            self.peticiones += 1
+
+    def _contar_bytes(self, n):
+        with self._lock:
+            self.bytes_enviados += n
+
+    def responder(self, path, query):
+        """Devuelve (cuerpo, headers) para un path relativo a la API. Lanza KeyError si no existe."""
+        m = re.fullmatch(r"accounts/(\d+)", path)
+        if m:
+            return {"id": int(m.group(1)), "name": f"Subcuenta {m.group(1)}"}, {}
+        m = re.fullmatch(r"accounts/(\d+)/courses", path)
+        if m:
+            cursos = [{"id": c.course_id} for c in self.cursos.values() if str(c.account_id) == m.group(1)]
+            return _Listado(cursos), {}
+        m = re.fullmatch(r"users/(\d+)", path)
+        if m:
+            return {"id": int(m.group(1)), "name": f"Estudiante {m.group(1)}"}, {}
+
+        m = re.fullmatch(r"courses/(\d+)(?:/(.*))?", path)
+        if not m:
+            raise KeyError(path)
+        curso = self.cursos[int(m.group(1))]
+        resto = m.group(2) or ""
+
+        if resto == "":
+            return {"id": curso.course_id, "name": f"Curso sintético {curso.course_id}",
+                    "course_code": f"SINT-{curso.course_id}", "sis_course_id": None,
+                    "account_id": curso.account_id}, {}
+        if resto == "outcome_groups":
+            return _Listado([{"id": gid, "title": curso.grupos[gid]["title"]} for gid in curso.raices]), {}
+        m = re.fullmatch(r"outcome_groups/(\d+)/(subgroups|outcomes)", resto)
+        if m:
+            grupo = curso.grupos[int(m.group(1))]
+            if m.group(2) == "subgroups":
+                return _Listado([{"id": gid, "title": curso.grupos[gid]["title"]} for gid in grupo["children"]]), {}
+            return _Listado([{"outcome": {"id": oid, "title": curso.outcomes[oid]}} for oid in grupo["outcomes"]]), {}
+        if resto == "outcome_results":
+            return _Listado(curso.resultados, key="outcome_results"), {}
+        if resto == "outcome_rollups":
+            linked = {"outcomes": [{"id": oid, "title": t, "points_possible": 4} for oid, t in curso.outcomes.items()]}
+            return _Listado(curso.rollups(), key="rollups", extra={"linked": linked}), {}
+        if resto == "users":
+            return _Listado([{"id": uid, "name": f"Estudiante {uid}"} for uid in curso.usuarios]), {}
+        if resto == "assignment_groups":
+            return _Listado(curso.grupos_de_tareas), {}
+        if resto == "assignments":
+            return _Listado(curso.tareas), {}
+        raise KeyError(path)
@@ -0,0 +1,141 @@
+"""
+Instrumentación por etapa: duración, peticiones HTTP, bytes, reintentos y aciertos de caché.
+
+    metricas = Metricas()
+    with instrumentar(metricas):
+        procesar_curso(client, store, course_id)
+    print(metricas.a_prometheus())
+
+La colección activa y la etapa en curso viajan en ContextVars, así que cada petición se
+atribuye a la etapa que la originó aunque corra en otro hilo (los pools del paquete usan
+propagar()) o en otra tarea de asyncio. Sin instrumentar() activo no se registra nada.
+Las etapas pueden solaparse (p. ej. resultados y árboles se descargan a la vez), así que
+la suma de sus segundos puede superar el tiempo total.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger("competencias.metricas")
+
+CAMPOS = ("segundos", "llamadas", "peticiones", "bytes", "reintentos", "cache_hits")
+
+_metricas = ContextVar("metricas", default=None)
+_etapa = ContextVar("etapa", default="otros")
+
+class Metricas:
+    """Acumulador de métricas por etapa, seguro entre hilos. Las etapas quedan en orden de aparición."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._etapas = {}
+
+    def sumar(self, etapa, **valores):
+        with self._lock:
+            fila = self._etapas.setdefault(etapa, dict.fromkeys(CAMPOS, 0))
+            for campo, valor in valores.items():
+                fila[campo] += valor
+
+    def filas(self):
+        """Lista de dicts {'etapa', 'segundos', 'llamadas', 'peticiones', ...}."""
+        with self._lock:
+            return [{"etapa": etapa, **fila, "segundos": round(fila["segundos"], 4)}
+                    for etapa, fila in self._etapas.items()]
+
+    def totales(self):
+        """Suma de todas las etapas (los segundos pueden solaparse)."""
+        totales = dict.fromkeys(CAMPOS, 0)
+        for fila in self.filas():
+            for campo in CAMPOS:
+                totales[campo] += fila[campo]
+        totales["segundos"] = round(totales["segundos"], 4)
+        return totales
+
+    def a_json(self, **contexto):
+        return json.dumps({**contexto, "etapas": self.filas(), "totales": self.totales()}, ensure_ascii=False)
+
+    def a_prometheus(self, prefijo="competencias"):
+        """Formato de exposición de texto de Prometheus (contadores con la etiqueta 'etapa')."""
+        lineas = []
+        filas = self.filas()
+        for campo in CAMPOS:
+            nombre = f"{prefijo}_etapa_{campo}_total"
+            lineas.append(f"# TYPE {nombre} counter")
+            for fila in filas:
+                etapa = fila["etapa"].replace("\\", "\\\\").replace('"', '\\"')
+                lineas.append(f'{nombre}{{etapa="{etapa}"}} {fila[campo]}')
+        return "\n".join(lineas) + "\n"
+
+@contextmanager
+def instrumentar(metricas=None):
+    """Activa 'metricas' (o una nueva) para todo lo que se ejecute dentro del bloque."""
+    metricas = metricas if metricas is not None else Metricas()
+    token = _metricas.set(metricas)
+    try:
+        yield metricas
+    finally:
+        _metricas.reset(token)
+
+@contextmanager
+def etapa(nombre):
+    """Atribuye a 'nombre' el tiempo del bloque y las peticiones que se hagan dentro de él."""
+    metricas = _metricas.get()
+    if metricas is None:
+        yield
+        return
+    token = _etapa.set(nombre)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas.sumar(nombre, segundos=time.perf_counter() - inicio, llamadas=1)
+        _etapa.reset(token)
+
+def en_etapa(nombre, funcion):
+    """Envuelve 'funcion' para que cada llamada se mida como la etapa 'nombre'."""
+    def medida(*args, **kwargs):
+        with etapa(nombre):
+            return funcion(*args, **kwargs)
+    return medida
+
+def propagar(funcion):
+    """
+    Envuelve 'funcion' para que, al ejecutarse en otro hilo, vea las métricas y la
+    etapa activas en el hilo que la envolvió (los hilos no heredan el contexto).
+    """
+    contexto = copy_context()
+
+    def en_contexto(*args, **kwargs):
+        return contexto.copy().run(funcion, *args, **kwargs)
+    return en_contexto
+
+def registrar_peticion(bytes_recibidos, reintento=False):
+    metricas = _metricas.get()
+    if metricas is not None:
+        metricas.sumar(_etapa.get(), peticiones=1, bytes=bytes_recibidos, reintentos=int(reintento))
+
+def registrar_cache():
+    metricas = _metricas.get()
+    if metricas is not None:
+        metricas.sumar(_etapa.get(), cache_hits=1)
+
+def activar_log(stream=None):
+    """
+    Para las aplicaciones (la app y la CLI; el paquete no configura logging por su cuenta):
+    envía el logger 'competencias.metricas' a 'stream' (por defecto, stderr) con nivel INFO,
+    una línea JSON por registro. Llamarla de nuevo no agrega otro handler.
+    """
+    if not any(getattr(h, "_competencias", False) for h in logger.handlers):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler._competencias = True
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def log_json(metricas, **contexto):
+    """Emite las métricas como una línea JSON en el logger 'competencias.metricas' (nivel INFO)."""
+    logger.info(metricas.a_json(**contexto))
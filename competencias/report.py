@@ -0,0 +1,314 @@
+"""
+Cálculo completo de un curso (o de varios) y armado de la tabla de resultados.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import re
+
+import pandas as pd
+import requests
+
+from .aggregation import (
+    CATEGORIAS,
+    AcumuladorResultados,
+    calcular_distribuciones,
+    resultados_a_dataframe,
+    rollups_a_dataframe,
+    validar_umbrales,
+)
+from .canvas import (
+    acumular_outcome_results,
+    fetch_outcome_rollups,
+    gather_outcomes_for_groups,
+    get_course_details,
+    get_outcome_groups,
+    sync_outcome_results,
+)
+from .config import BATCH_WORKERS, GRUPOS_COMPETENCIA, SUBGRUPOS_COMPETENCIA
+from .metrics import en_etapa, etapa, propagar
+
+# Fuentes de datos para los promedios:
+# - "resultados": cada outcome_result individual (exacto, permite el detalle por criterio)
+# - "rollups": puntajes ya agregados por Canvas por usuario y outcome (mucho más livianos,
+#   pero siguen el método de cálculo del outcome, así que pueden diferir levemente)
+# - "streaming": los mismos outcome_results, pero cada página se suma a acumuladores por
+#   usuario y outcome y se descarta; la memoria no crece con la cantidad de resultados,
+#   a cambio de no usar la copia local incremental (cada consulta descarga todo)
+FUENTE_RESULTADOS = "resultados"
+FUENTE_ROLLUPS = "rollups"
+FUENTE_STREAMING = "streaming"
+FUENTES = (FUENTE_RESULTADOS, FUENTE_ROLLUPS, FUENTE_STREAMING)
+
+class CursoSinCompetencias(Exception):
+    """El curso no tiene resultados o competencias compatibles para calcular distribuciones."""
+
+def compilar_filtro_grupos(patron=GRUPOS_COMPETENCIA):
+    """
+    Compila un patrón de títulos de grupo (ver config.GRUPOS_COMPETENCIA): debe calzar con
+    el inicio del título, sin distinguir mayúsculas. Una regex ya compilada se devuelve tal cual.
+    """
+    if isinstance(patron, re.Pattern):
+        return patron
+    return re.compile(patron, re.IGNORECASE)
+
+# Filtros de config, compilados una sola vez. Sin SUBGRUPOS_COMPETENCIA no se poda ningún subgrupo.
+FILTRO_GRUPOS = compilar_filtro_grupos()
+FILTRO_SUBGRUPOS = compilar_filtro_grupos(SUBGRUPOS_COMPETENCIA) if SUBGRUPOS_COMPETENCIA else None
+
+def _filtrar_grupos(all_groups_data, filtro=FILTRO_GRUPOS):
+    """
+    Devuelve los grupos raíz cuyo título calza con 'filtro' (por defecto "cd", "cp" o "cg"),
+    agrupados por título: {titulo: [group_id, ...]} en el orden en que los entrega Canvas.
+    """
+    if isinstance(all_groups_data, list):
+        groups_list = all_groups_data
+    elif isinstance(all_groups_data, dict):
+        groups_list = all_groups_data.get("outcome_groups", [])
+    else:
+        groups_list = []
+
+    grupos_filtrados = {}
+    for g in groups_list:
+        if filtro.match(g.get("title", "").strip()):
+            grupos_filtrados.setdefault(g.get("title", "Sin título"), [])
+            if g.get("id"):
+                grupos_filtrados[g.get("title", "Sin título")].append(g["id"])
+    return grupos_filtrados
+
+def _outcomes_de_titulo(course_id, group_ids, client, filtro_subgrupos=None):
+    """
+    Outcomes (id+title) de los grupos raíz que comparten un mismo título.
+    Si hay varios con outcomes, gana el último (como al armar un dict por título).
+    """
+    return _ultimo_con_outcomes(
+        gather_outcomes_for_groups(course_id, group_ids, client, filtro_subgrupos=filtro_subgrupos), group_ids)
+
+def _ultimo_con_outcomes(outcomes_por_grupo, group_ids):
+    """Regla de _outcomes_de_titulo sobre el resultado de gather_outcomes_for_groups."""
+    listas = [outcomes_por_grupo[gid] for gid in group_ids if outcomes_por_grupo[gid]]
+    return listas[-1] if listas else []
+
+def _cargar_resultados(client, store, course_id):
+    """Sincroniza los outcome_results. Devuelve (resultados_df, total, novedades)."""
+    resultados, novedades = sync_outcome_results(client, store, course_id)
+    return resultados_a_dataframe(resultados), len(resultados), novedades
+
+def _cargar_rollups(client, course_id):
+    """Descarga los outcome_rollups. Devuelve (resultados_df, total, None)."""
+    try:
+        rollups, outcomes = fetch_outcome_rollups(client, course_id)
+    except requests.exceptions.HTTPError as e:
+        raise _error_de_rollups(e) from e
+    return rollups_a_dataframe(rollups, outcomes), len(rollups), None
+
+def _error_de_rollups(error):
+    return RuntimeError(f"No se pudieron obtener los rollups del curso. "
+                        f"Código de error: {error.response.status_code}. Contacta con el administrador.")
+
+def _cargar_streaming(client, course_id):
+    """Suma los outcome_results página por página. Devuelve (resultados_df, total, None)."""
+    acumulador = acumular_outcome_results(client, course_id, AcumuladorResultados())
+    return acumulador.a_dataframe(), acumulador.total, None
+
+def _cargador(fuente):
+    """Función (client, store, course_id) -> (resultados_df, total, novedades) de cada fuente."""
+    if fuente == FUENTE_ROLLUPS:
+        return lambda client, store, course_id: _cargar_rollups(client, course_id)
+    if fuente == FUENTE_STREAMING:
+        return lambda client, store, course_id: _cargar_streaming(client, course_id)
+    return _cargar_resultados
+
+def _sin_grupos(total_resultados):
+    """Error de un curso sin grupos raíz que calcen con el filtro."""
+    if not total_resultados:
+        return CursoSinCompetencias("No hay competencias en este curso!")
+    return CursoSinCompetencias("No se encontraron competencias compatibles en el curso!")
+
+def _nuevo_resumen(course_info, total_resultados, novedades, fuente):
+    """
+    Resumen de procesar_curso, aún sin competencias (ver _sumar_competencia).
+    Lanza CursoSinCompetencias si el curso no tiene resultados.
+    """
+    if not total_resultados:
+        raise CursoSinCompetencias("No hay competencias en este curso!")
+    return {
+        "course_info": course_info,
+        "grupo_to_outcomes_info": {},
+        "dist_grupos": {},
+        "dist_criterios": {},
+        "total_resultados": total_resultados,
+        "novedades": novedades,
+        "fuente": fuente,
+    }
+
+def _sumar_competencia(resumen, resultados_df, titulo, outcomes_list, umbrales):
+    """
+    Calcula una competencia cuyo árbol ya se descargó y la suma al resumen.
+    Devuelve el evento de procesar_curso_progresivo: "grupo" o "sin_criterios".
+    """
+    if not outcomes_list:
+        return "sin_criterios", titulo
+    with etapa("agregación"):
+        dist_grupo, dist_crit = calcular_distribuciones(resultados_df, {titulo: outcomes_list}, umbrales)
+    resumen["grupo_to_outcomes_info"][titulo] = outcomes_list
+    resumen["dist_grupos"].update(dist_grupo)
+    resumen["dist_criterios"].update(dist_crit)
+    return "grupo", (titulo, outcomes_list, dist_grupo[titulo], dist_crit)
+
+def _cerrar_resumen(resumen, grupos_filtrados):
+    """
+    Deja las competencias del resumen en el orden de Canvas y lo devuelve.
+    Lanza CursoSinCompetencias si ninguna tiene criterios.
+    """
+    outcomes_por_titulo = resumen["grupo_to_outcomes_info"]
+    if not outcomes_por_titulo:
+        raise CursoSinCompetencias("Las competencias no tienen criterios asociados.")
+    resumen["grupo_to_outcomes_info"] = {t: outcomes_por_titulo[t] for t in grupos_filtrados if t in outcomes_por_titulo}
+    return resumen
+
+def procesar_curso_progresivo(client, store, course_id, fuente=FUENTE_RESULTADOS, filtro=FILTRO_GRUPOS,
+                              filtro_subgrupos=FILTRO_SUBGRUPOS, umbrales=None):
+    """
+    Igual que procesar_curso, pero entrega cada etapa apenas está lista para poder
+    mostrarla de inmediato. Los outcome_results, los detalles del curso y el árbol
+    de cada competencia se descargan al mismo tiempo.
+    'filtro' y 'filtro_subgrupos' (patrones o regex compiladas) y 'umbrales' reemplazan
+    a los de config (ver procesar_curso).
+
+    Genera tuplas (evento, datos):
+    - ("grupos", [titulo, ...]): competencias encontradas (con al menos un grupo), en el
+      orden de Canvas; por cada una llega después un evento "grupo" o "sin_criterios"
+    - ("curso", course_info)
+    - ("resultados", {"total_resultados": n, "novedades": m}); con rollups, n es la
+      cantidad de usuarios; con rollups y streaming, m es None
+    - ("grupo", (titulo, outcomes_list, dist_grupo, dist_criterios)): en orden de llegada
+    - ("sin_criterios", titulo): la competencia no tiene outcomes y no se muestra
+    - ("fin", resumen): el mismo dict que retorna procesar_curso
+    Lanza las mismas excepciones que procesar_curso.
+    """
+    if umbrales is not None:
+        umbrales = validar_umbrales(umbrales)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        f_resultados = executor.submit(propagar(en_etapa("resultados", _cargador(fuente))), client, store, course_id)
+        f_curso = executor.submit(propagar(en_etapa("curso", get_course_details)), course_id, client)
+
+        # 1) Grupos del curso: apenas se conocen, se lanza la descarga del árbol de cada uno
+        with etapa("grupos"):
+            grupos_filtrados = _filtrar_grupos(get_outcome_groups(course_id, client), compilar_filtro_grupos(filtro))
+        if not grupos_filtrados:
+            raise _sin_grupos(f_resultados.result()[1])
+
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as arboles:
+            outcomes_de_titulo = propagar(en_etapa("árbol", _outcomes_de_titulo))
+            if filtro_subgrupos is not None:
+                filtro_subgrupos = compilar_filtro_grupos(filtro_subgrupos)
+            f_arboles = {arboles.submit(outcomes_de_titulo, course_id, gids, client, filtro_subgrupos): titulo
+                         for titulo, gids in grupos_filtrados.items() if gids}
+            yield "grupos", list(f_arboles.values())
+
+            # 2) Información del curso y outcome_results
+            course_info = f_curso.result()
+            yield "curso", course_info
+
+            resultados_df, total_resultados, novedades = f_resultados.result()
+            resumen = _nuevo_resumen(course_info, total_resultados, novedades, fuente)
+            yield "resultados", {"total_resultados": total_resultados, "novedades": novedades}
+
+            # 3) Cada competencia se calcula apenas termina de descargarse su árbol
+            for future in as_completed(f_arboles):
+                yield _sumar_competencia(resumen, resultados_df, f_arboles[future], future.result(), umbrales)
+
+    yield "fin", _cerrar_resumen(resumen, grupos_filtrados)
+
+def procesar_curso(client, store, course_id, fuente=FUENTE_RESULTADOS, filtro=FILTRO_GRUPOS,
+                   filtro_subgrupos=FILTRO_SUBGRUPOS, umbrales=None):
+    """
+    Ejecuta todo el cálculo para un curso sin tocar la interfaz (se puede llamar desde hilos).
+    Lanza RuntimeError/HTTPError si falla la descarga y CursoSinCompetencias si no hay
+    nada que calcular.
+
+    Las competencias son los grupos raíz cuyo título calza con 'filtro'; dentro de cada una
+    se recorren solo los subgrupos que calzan con 'filtro_subgrupos' (None: todos). Los
+    promedios se clasifican con 'umbrales' (None: UMBRALES). Por defecto, todo sale de config.
+
+    Retorna un dict con:
+    - course_info, grupo_to_outcomes_info, dist_grupos, dist_criterios
+    - total_resultados y novedades (de la sincronización incremental)
+    - fuente: de dónde salieron los promedios (una de FUENTES)
+    """
+    for evento, datos in procesar_curso_progresivo(client, store, course_id, fuente, filtro, filtro_subgrupos, umbrales):
+        if evento == "fin":
+            return datos
+
+def leer_ids_de_cursos(texto):
+    """Extrae los IDs de curso (números) de un texto libre, sin repetir y en orden."""
+    return list(dict.fromkeys(re.findall(r"\d+", texto or "")))
+
+def leer_ids_de_csv(archivo):
+    """
+    Lee los IDs de curso de un CSV. Usa la columna 'course_id' (o 'id') si existe;
+    si no, la primera columna.
+    """
+    df = pd.read_csv(archivo, dtype=str)
+    if df.empty:
+        return []
+    columnas = {c.strip().lower(): c for c in df.columns}
+    columna = columnas.get("course_id") or columnas.get("id") or df.columns[0]
+    return leer_ids_de_cursos(" ".join(df[columna].dropna()))
+
+def procesar_cursos(client, store, course_ids, max_workers=BATCH_WORKERS, on_progress=None,
+                    procesar=None, fuente=FUENTE_RESULTADOS, filtro=FILTRO_GRUPOS,
+                    filtro_subgrupos=FILTRO_SUBGRUPOS, umbrales=None):
+    """
+    Procesa varios cursos en paralelo con un pool acotado de hilos.
+    'on_progress(hechos, total, course_id, error)' se llama desde el hilo que invoca
+    esta función cada vez que termina un curso.
+    'procesar(course_id)' reemplaza a procesar_curso (p. ej. por una versión memoizada).
+    'fuente', 'filtro', 'filtro_subgrupos' y 'umbrales' se pasan a procesar_curso.
+
+    Retorna (resumenes, errores):
+    - resumenes: [(course_id, resumen de procesar_curso)] en el orden recibido
+    - errores: {course_id: mensaje}
+    """
+    if procesar is None:
+        def procesar(cid):
+            return procesar_curso(client, store, cid, fuente, filtro, filtro_subgrupos, umbrales)
+
+    resumenes, errores = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        procesar_en_hilo = propagar(procesar)
+        futures = {executor.submit(procesar_en_hilo, cid): cid for cid in course_ids}
+        for done, future in enumerate(as_completed(futures), start=1):
+            cid = futures[future]
+            try:
+                resumenes[cid] = future.result()
+            except (CursoSinCompetencias, RuntimeError, requests.exceptions.RequestException) as e:
+                errores[cid] = str(e)
+            if on_progress:
+                on_progress(done, len(futures), cid, errores.get(cid))
+    return [(cid, resumenes[cid]) for cid in course_ids if cid in resumenes], errores
+
+def tabla_combinada(resumenes, incluir_criterios=False):
+    """
+    Une los resultados de varios cursos en una sola tabla: una fila por curso y
+    competencia (y por criterio si 'incluir_criterios'), con una columna por categoría.
+    """
+    filas = []
+    for course_id, resumen in resumenes:
+        info = resumen["course_info"]
+        base = {
+            "Curso ID": course_id,
+            "Curso": info["course_name"],
+            "Código": info["course_code"],
+            "Subcuenta": info["subaccount_name"],
+        }
+        for grupo_title, outcomes_list in resumen["grupo_to_outcomes_info"].items():
+            dist = resumen["dist_grupos"][grupo_title]
+            filas.append({**base, "Competencia": grupo_title, "Criterio": "",
+                          **{d["Categoría"]: d["Porcentaje"] for d in dist}})
+            if incluir_criterios:
+                for oid, otitle in outcomes_list:
+                    dist = resumen["dist_criterios"][oid]
+                    filas.append({**base, "Competencia": grupo_title, "Criterio": otitle,
+                                  **{d["Categoría"]: d["Porcentaje"] for d in dist}})
+    return pd.DataFrame(filas, columns=["Curso ID", "Curso", "Código", "Subcuenta",
+                                        "Competencia", "Criterio"] + CATEGORIAS)
@@ -2,500 +2,438 @@ import streamlit as st
 import requests
 from decouple import config
 import pandas as pd
-from collections import defaultdict
 import time
+import html
+from concurrent.futures import ThreadPoolExecutor
+
+from competencias import (
+    CanvasCache,
+    CanvasClient,
+    CursoSinCompetencias,
+    ResultsStore,
+    SnapshotStore,
+    get_account_course_ids,
+    get_assignments_with_weights,
+    leer_ids_de_csv,
+    leer_ids_de_cursos,
+    procesar_curso_progresivo,
+    procesar_cursos,
+    tabla_combinada,
+)
+from competencias.aio import ProcesadorAsincrono
+from competencias.metrics import Metricas, activar_log, en_etapa, etapa, instrumentar, log_json, propagar
+from competencias.report import FUENTE_RESULTADOS, FUENTE_ROLLUPS
+from competencias.config import CACHE_PATH, CANVAS_BASE_URL, SNAPSHOTS_PATH
 
 # Configuración inicial de la app
 st.set_page_config(page_title="Promediador de Competencias! 🤖", page_icon="🤖")
+activar_log()  # Una línea JSON de métricas por consulta en stderr (logger "competencias.metricas")
 st.title("Promediador de Competencias por Curso 🤖".upper())
 st.write("Ingresa el ID de un curso y presiona el botón para obtener un promedio por competencia del curso. Si marcas la casilla, podrás ver el detalle de cada criterio.")
 
 # Datos de tu Canvas
 canvas_token = config("TOKEN")  # O colócalo directamente en una variable (no recomendado en producción)
-canvas_base_url = "https://canvas.uautonoma.cl/api/v1"
-
-# Input de texto para el curso
-course_id = st.text_input("Ingresa el ID del curso", "")
+canvas_base_url = CANVAS_BASE_URL
+RESULTADOS_TTL = 15 * 60  # Segundos que se reutiliza en memoria el cálculo de un curso
+RESULTADOS_MAX_ENTRIES = 64
+
+# Modo: un curso o varios cursos (lista, CSV o subcuenta completa)
+modo = st.radio("Modo", ["Un curso", "Varios cursos"], horizontal=True)
+
+if modo == "Un curso":
+    # Input de texto para el curso
+    course_id = st.text_input("Ingresa el ID del curso", "")
+else:
+    course_ids_text = st.text_area("IDs de cursos (separados por coma, espacio o salto de línea)", "")
+    course_ids_csv = st.file_uploader("...o sube un CSV con una columna de IDs de curso", type="csv")
+    account_id = st.text_input("...o ingresa el ID de una subcuenta para procesar todos sus cursos", "")
+    include_subaccounts = st.checkbox("Incluir cursos de subcuentas hijas", value=True)
 
 # Checkbox para mostrar/ocultar detalle
 show_details = st.checkbox("Mostrar criterios de cada competencia")
 
-def style_table(df):
-    """
-    Aplica estilos de color según la categoría.
+# Checkbox para ignorar la caché local y revalidar todo contra Canvas
+force_refresh = st.checkbox("Forzar actualización (ignorar caché)")
+
+# Fuente de los promedios: los rollups de Canvas son mucho más livianos, pero para ver el
+# detalle por criterio (o el cálculo exacto) se usan los outcome_results individuales
+usar_rollups = st.checkbox("Modo rápido (usar promedios agregados por Canvas)",
+                           help="Usa /outcome_rollups. Al mostrar los criterios se usan siempre los resultados individuales.")
+fuente = FUENTE_ROLLUPS if usar_rollups and not show_details else FUENTE_RESULTADOS
+
+# Las instantáneas precalculadas (python -m competencias snapshot) se muestran al instante;
+# este checkbox obliga a recalcular contra Canvas
+en_vivo = st.checkbox("Calcular en vivo (ignorar instantáneas precalculadas)")
+
+# Checkbox para ver en qué se fue el tiempo de la consulta (duración, peticiones y caché por etapa)
+mostrar_depuracion = st.checkbox("Mostrar panel de depuración")
+
+# Colores (fondo, texto) de cada categoría en las tablas
+COLORES_CATEGORIA = {
+    "Excede el dominio": ("#4CAF50", "white"),  # Verde
+    "Reúne el dominio": ("#FFC107", "black"),  # Amarillo
+    "Cerca del dominio": ("#FF9800", "black"),  # Naranja
+    "Muy por debajo del dominio": ("#F44336", "white"),  # Rojo
+}
+# Celda ya armada de cada categoría y estilo común: las tablas se arman concatenando texto
+CELDAS_CATEGORIA = {
+    cat: f'<td style="background-color: {fondo}; color: {texto};">{html.escape(cat)}</td>'
+    for cat, (fondo, texto) in COLORES_CATEGORIA.items()
+}
+ESTILO_TABLAS = "<style>table.competencias th, table.competencias td { text-align: left; }</style>"
+
+def tabla_html(distribucion):
     """
-    def color_by_category(val):
-        """Asigna colores según la categoría."""
-        if val == "Excede el dominio":
-            return 'background-color: #4CAF50; color: white;'  # Verde
-        elif val == "Reúne el dominio":
-            return 'background-color: #FFC107; color: black;'  # Amarillo
-        elif val == "Cerca del dominio":
-            return 'background-color: #FF9800; color: black;'  # Naranja
-        elif val == "Muy por debajo del dominio":
-            return 'background-color: #F44336; color: white;'  # Rojo
-        return ''
-
-    styles = [
-        {'selector': 'th', 'props': [('text-align', 'left')]},
-        {'selector': 'td', 'props': [('text-align', 'left')]},
-    ]
-    return df.style.set_table_styles(styles).map(color_by_category, subset=['Categoría'])
-
-def fetch_all_results(headers, base_url, course_id):
+    Tabla HTML (Categoría, Porcentaje) de una distribución, coloreada según la categoría.
+    Se arma directamente como texto, sin DataFrame ni Styler.
     """
-    Obtiene TODOS los outcome_results de un curso, paginando hasta que no haya más.
-    Devuelve una lista con todos los 'outcome_results'.
+    filas = []
+    for d in distribucion:
+        celda = CELDAS_CATEGORIA.get(d["Categoría"]) or f"<td>{html.escape(d['Categoría'])}</td>"
+        filas.append(f"<tr>{celda}<td>{html.escape(d['Porcentaje'])}</td></tr>")
+    return ('<table class="competencias"><thead><tr><th>Categoría</th><th>Porcentaje</th></tr></thead>'
+            f"<tbody>{''.join(filas)}</tbody></table>")
+
+# Colores de la ponderación de una tarea: (desde %, fondo, texto)
+COLORES_PONDERACION = [
+    (80, "#4CAF50", "white"),  # Verde
+    (60, "#FFC107", "black"),  # Amarillo
+    (40, "#FF9800", "black"),  # Naranja
+    (0, "#F44336", "white"),  # Rojo
+]
+
+def tabla_tareas_html(tareas):
+    """Tabla HTML (Tarea, Ponderación) con la ponderación coloreada según el porcentaje."""
+    filas = []
+    for t in tareas:
+        pct = float(t["Ponderación"].rstrip("%"))
+        _, fondo, texto = next((c for c in COLORES_PONDERACION if pct >= c[0]), COLORES_PONDERACION[-1])
+        filas.append(f"<tr><td>{html.escape(t['Tarea'])}</td>"
+                     f'<td style="background-color: {fondo}; color: {texto};">{html.escape(t["Ponderación"])}</td></tr>')
+    return ('<table class="competencias"><thead><tr><th>Tarea</th><th>Ponderación</th></tr></thead>'
+            f"<tbody>{''.join(filas)}</tbody></table>")
+
+@st.cache_resource
+def get_canvas_client(base_url, token):
     """
-    resultados = []
-    page = 1
-    while True:
-        url = f"{base_url}/courses/{course_id}/outcome_results?per_page=100&page={page}"
-        response = requests.get(url, headers=headers)
-
-        if response.status_code == 200:
-            data = response.json().get('outcome_results', [])
-            if not data:
-                break
-            resultados.extend(data)
-            page += 1
-        else:
-            st.error(f"No se pudo obtener los datos en la página {page}. "
-                     f"Código de error: {response.status_code}. Contacta con el administrador.")
-            break
-    return resultados
-
-def get_outcome_groups(course_id, headers):
+    Un único cliente por (URL, token), compartido entre ejecuciones del script
+    para reutilizar las conexiones abiertas y la caché en disco.
     """
-    Obtiene los grupos de competencias (Outcome Groups) de un curso (nivel raíz).
-    Puede devolver una lista o un dict con 'outcome_groups'.
-    """
-    url = f"{canvas_base_url}/courses/{course_id}/outcome_groups"
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
+    return CanvasClient(base_url, token, cache=CanvasCache(CACHE_PATH))
 
-def get_subgroups(course_id, group_id, headers):
+@st.cache_resource
+def get_procesador(base_url, token):
     """
-    Retorna los subgrupos de un grupo específico.
+    Capa asíncrona (httpx) para calcular cursos completos, compartida entre ejecuciones
+    del script: un event loop de fondo con sus propias conexiones y la misma caché en disco.
     """
-    url = f"{canvas_base_url}/courses/{course_id}/outcome_groups/{group_id}/subgroups"
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    return resp.json()
-
-def get_outcomes_in_group(course_id, group_id, headers):
+    return ProcesadorAsincrono(base_url, token, cache=get_canvas_client(base_url, token).cache)
+
+@st.cache_resource
+def get_results_store():
+    """Copia local de outcome_results, compartida entre ejecuciones del script."""
+    return ResultsStore(CACHE_PATH)
+
+@st.cache_resource
+def get_snapshot_store():
+    """Instantáneas generadas por la tarea programada, compartidas entre ejecuciones del script."""
+    return SnapshotStore(SNAPSHOTS_PATH)
+
+def buscar_instantanea(course_id):
+    """La instantánea más reciente del curso, o None si hay que calcularlo en vivo."""
+    if en_vivo or force_refresh:
+        return None
+    return get_snapshot_store().latest(course_id)
+
+@st.cache_data(ttl=RESULTADOS_TTL, max_entries=RESULTADOS_MAX_ENTRIES, show_spinner=False)
+def calcular_curso(base_url, token, course_id, version, fuente=FUENTE_RESULTADOS, _resumen=None):
     """
-    Retorna la lista de 'relaciones' entre un grupo de competencias y sus Outcomes.
-    Cada elemento suele tener la forma:
-    {
-      "outcome": {"id": 123, "title": "..."},
-      ...
-    }
+    procesar_curso (en la capa asíncrona, ver get_procesador) memoizado en memoria: volver
+    a ejecutar el script (p. ej. al marcar "Mostrar criterios") reutiliza el resultado
+    sin consultar Canvas.
+    'version' cambia al forzar la actualización, para no reutilizar un cálculo anterior.
+    Si se entrega '_resumen' (ya calculado mientras se mostraba por etapas), solo se
+    guarda en la caché; no forma parte de la clave.
     """
-    url = f"{canvas_base_url}/courses/{course_id}/outcome_groups/{group_id}/outcomes"
-    resp = requests.get(url, headers=headers)
-    resp.raise_for_status()
-    return resp.json()  # Típicamente es una lista con subclave 'outcome'.
+    if _resumen is not None:
+        return _resumen
+    return get_procesador(base_url, token).procesar_curso(get_results_store(), course_id, fuente)
 
-def gather_outcomes_with_titles(course_id, group_id, headers):
+@st.cache_data(ttl=RESULTADOS_TTL, max_entries=RESULTADOS_MAX_ENTRIES, show_spinner=False)
+def calcular_tareas(base_url, token, course_id, version):
     """
-    Recolecta (en una lista) TODOS los outcomes (competencias) que vivan en
-    este grupo y en sus subgrupos, de forma recursiva.
-    
-    Devuelve pares (outcome_id, outcome_title).
+    Tareas del curso y su ponderación, memorizadas igual que calcular_curso.
+    Si la descarga falla lanza RuntimeError, que no se memoriza.
     """
-    results = []
-
-    # 1) Obtener 'relaciones' de este grupo con sus outcomes
-    data_outcomes = get_outcomes_in_group(course_id, group_id, headers)
-    if isinstance(data_outcomes, list):
-        for item in data_outcomes:
-            outcome_data = item.get("outcome", {})
-            oid = outcome_data.get("id")
-            otitle = outcome_data.get("title", f"Outcome {oid}")
-            if oid:
-                results.append((oid, otitle))
-
-    # 2) Obtener subgrupos
-    data_subgroups = get_subgroups(course_id, group_id, headers)
-    subgroups_list = []
-    if isinstance(data_subgroups, list):
-        subgroups_list = data_subgroups
-    elif isinstance(data_subgroups, dict):
-        subgroups_list = data_subgroups.get("outcome_groups", [])
-
-    # 3) Recorrer cada subgrupo y llamar recursivamente
-    for sg in subgroups_list:
-        sg_id = sg.get("id")
-        if sg_id:
-            child_outcomes = gather_outcomes_with_titles(course_id, sg_id, headers)
-            results.extend(child_outcomes)
-
-    return results
-
-def get_course_details(course_id, headers):
-    """
-    Obtiene detalles básicos del curso (nombre, sis_course_id, subcuenta).
-    No es estrictamente necesario para el cálculo, pero se usa para mostrar info.
-    """
-    course_url = f"{canvas_base_url}/courses/{course_id}"
-    course_resp = requests.get(course_url, headers=headers)
-    course_resp.raise_for_status()
-    course_data = course_resp.json()
-
-    account_id = course_data.get("account_id", "")
-    account_url = f"{canvas_base_url}/accounts/{account_id}"
-    account_resp = requests.get(account_url, headers=headers)
-    if account_resp.status_code == 200:
-        account_data = account_resp.json()
-        subaccount_name = account_data.get("name", "")
-    else:
-        subaccount_name = ""
+    return get_assignments_with_weights(course_id, get_canvas_client(base_url, token))
 
-    return {
-        "course_name": course_data.get("name", f"Curso {course_id}"),
-        "sis_course_id": course_data.get("sis_course_id"),
-        "course_code": course_data.get("course_code"),
-        "subaccount_name": subaccount_name
-    }
+def mostrar_encabezado(course_info):
+    st.subheader(course_info["subaccount_name"])
+    st.markdown(f"###### Curso: {course_info['course_name']} ({course_info['course_code']})")
 
-def clasificar_promedio(promedio):
-    """
-    Devuelve la categoría en base al promedio (0..1).
-    Ajusta si tu lógica es diferente (0..100, etc.).
-    """
-    if promedio >= 0.90:
-        return "Excede el dominio"
-    elif promedio >= 0.60:
-        return "Reúne el dominio"
-    elif promedio >= 0.40:
-        return "Cerca del dominio"
+def mostrar_sincronizacion(total_resultados, novedades):
+    if novedades is None:
+        st.caption(f"Promedios agregados por Canvas para {total_resultados} usuarios (modo rápido).")
     else:
-        return "Muy por debajo del dominio"
-
-def calcular_distribucion_categorias(user_to_scores):
+        st.caption(f"{total_resultados} resultados sincronizados "
+                   f"({novedades} nuevos o actualizados desde la última consulta).")
+    st.divider()
+
+def mostrar_instantanea(resumen):
+    st.caption(f"Instantánea calculada el {resumen['creado_en'].replace('T', ' ')} "
+               f"({resumen['total_resultados']} resultados). "
+               "Marca «Calcular en vivo» para consultar Canvas ahora.")
+    st.divider()
+
+def mostrar_tendencia(course_id, titulos):
+    """Evolución de cada competencia entre instantáneas (solo si hay más de una)."""
+    snapshots = get_snapshot_store()
+    if len(snapshots.dates(course_id)) < 2:
+        return
+    with st.expander("Evolución entre instantáneas"):
+        for titulo in titulos:
+            st.markdown(f"**{titulo}**")
+            st.line_chart(snapshots.trend(course_id, titulo))
+
+def mostrar_resumen(course_id, resumen):
+    """Muestra un curso ya calculado (desde la caché en memoria o desde una instantánea)."""
+    mostrar_encabezado(resumen["course_info"])
+    if "fecha" in resumen:
+        mostrar_instantanea(resumen)
+    else:
+        mostrar_sincronizacion(resumen["total_resultados"], resumen["novedades"])
+    st.markdown("###### Competencias encontradas:")
+    for grupo_title, outcomes_list in resumen["grupo_to_outcomes_info"].items():
+        mostrar_grupo(grupo_title, outcomes_list, resumen["dist_grupos"][grupo_title],
+                      resumen["dist_criterios"])
+    if "fecha" in resumen:
+        mostrar_tendencia(course_id, list(resumen["grupo_to_outcomes_info"]))
+
+def mostrar_grupo(grupo_title, outcomes_list, dist_grupo, dist_criterios):
     """
-    Dado un dict user->[lista_de_scores],
-    calcular cuántos usuarios hay en cada categoría y su porcentaje.
-    Retorna una lista de dicts con "Categoría" y "Porcentaje".
+    Muestra la distribución de una competencia y, si show_details, el detalle de cada criterio.
     """
-    categorias_count = defaultdict(int)
-    total_users = len(user_to_scores)
-
-    for _, scores in user_to_scores.items():
-        # Filtrar valores None y asegurarse de que sean floats
-        valid_scores = [s for s in scores if isinstance(s, (int, float))]
-
-        if valid_scores:
-            promedio = sum(valid_scores) / len(valid_scores)
-        else:
-            promedio = 0.0
-        cat = clasificar_promedio(promedio)
-        categorias_count[cat] += 1
-
-    data_distribution = []
-    for cat in ["Excede el dominio", "Reúne el dominio", "Cerca del dominio", "Muy por debajo del dominio"]:
-        if total_users > 0:
-            pct = (categorias_count[cat] / total_users) * 100
-        else:
-            pct = 0.0
-        data_distribution.append({
-            "Categoría": cat,
-            "Porcentaje": f"{pct:.1f}%"
-        })
-    return data_distribution
-
-def get_assignments_with_weights(course_id: int, canvas_base_url: str, headers: dict) -> list:
+    with etapa("render"):
+        st.markdown(f"#### {grupo_title}")
+        # Todas las tablas de la competencia van en un solo bloque HTML
+        partes = [ESTILO_TABLAS, tabla_html(dist_grupo)]
+
+        # Si el checkbox "show_details" está activado, mostramos detalle de cada competencia
+        if show_details and outcomes_list:
+            partes.append("##### :green[**Detalle de cada criterio en esta competencia:**]")
+            for (oid, otitle) in outcomes_list:
+                partes.append(f"**{html.escape(otitle)}**")  # (ID: {oid})
+                partes.append(tabla_html(dist_criterios[oid]))
+
+        st.markdown("\n\n".join(partes), unsafe_allow_html=True)
+        st.divider()
+
+def mostrar_curso_progresivo(course_id):
     """
-    Obtiene las tareas de un curso y su ponderación total.
-
-    Parámetros:
-    -----------
-    - course_id: int
-        El ID interno del curso en Canvas.
-    - canvas_base_url: str
-        La URL base de la instancia de Canvas, por ejemplo, "https://canvas.uautonoma.cl/api/v1".
-    - headers: dict
-        Encabezados para la autenticación de la API, por ejemplo, {"Authorization": "Bearer <TOKEN>"}.
-
-    Retorna:
-    --------
-    - list of dict:
-        [
-            {
-                "Tarea": "Nombre de la Tarea",
-                "Ponderación": "20.0%"
-            },
-            ...
-        ]
+    Calcula un curso mostrando cada etapa apenas está lista: el encabezado del curso,
+    el avance de cada descarga y la tabla de cada competencia en su lugar definitivo.
+    Devuelve el resumen completo (el mismo de procesar_curso).
     """
+    client = get_canvas_client(canvas_base_url, canvas_token)
+    estado = st.status("Descargando resultados, datos del curso y competencias...", expanded=True)
+    encabezado = st.container()
+    st.markdown("###### Competencias encontradas:")
+    lugares, listos = {}, 0
+
     try:
-        # Paso 1: Obtener todos los grupos de asignación (Assignment Groups)
-        assignment_groups = []
-        page = 1
-        while True:
-            url = f"{canvas_base_url}/courses/{course_id}/assignment_groups?per_page=100&page={page}"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                if not data:
-                    break
-                assignment_groups.extend(data)
-                page += 1
-            else:
-                print(f"Error al obtener los grupos de asignación en la página {page}. Código de error: {response.status_code}.")
-                return []
-        
-        # Crear un diccionario para mapear assignment_group_id a su ponderación
-        group_weights = {}
-        for group in assignment_groups:
-            group_id = group.get("id")
-            group_weight = group.get("group_weight", 0)  # Usar 'group_weight' en lugar de 'computed_weight'
-            if group_id is not None:
-                group_weights[group_id] = group_weight
-        
-        # Paso 2: Obtener todas las tareas (assignments) del curso
-        assignments = []
-        page = 1
-        while True:
-            url = f"{canvas_base_url}/courses/{course_id}/assignments?per_page=100&page={page}"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                data = response.json()
-                if not data:
-                    break
-                assignments.extend(data)
-                page += 1
-            else:
-                print(f"Error al obtener las tareas en la página {page}. Código de error: {response.status_code}.")
-                return []
-        
-        # Paso 3: Contar cuántas tareas hay en cada grupo de asignación
-        group_assignment_count = defaultdict(int)
-        for assignment in assignments:
-            group_id = assignment.get("assignment_group_id")
-            if group_id in group_weights:
-                group_assignment_count[group_id] += 1
-        
-        # Paso 4: Calcular la ponderación de cada tarea
-        assignments_with_weights = []
-        for assignment in assignments:
-            name = assignment.get("name", "Sin nombre")
-            group_id = assignment.get("assignment_group_id")
-            if group_id in group_weights:
-                total_group_weight = group_weights[group_id]
-                num_assignments_in_group = group_assignment_count[group_id]
-                if num_assignments_in_group > 0:
-                    assignment_weight = total_group_weight / num_assignments_in_group
+        for evento, datos in procesar_curso_progresivo(client, get_results_store(), course_id, fuente):
+            if evento == "grupos":
+                lugares = {titulo: st.empty() for titulo in datos}
+                avance = estado.progress(0.0, text=f"Competencias: 0/{len(datos)}")
+            elif evento == "curso":
+                estado.write("✅ Datos del curso")
+                with encabezado:
+                    mostrar_encabezado(datos)
+            elif evento == "resultados":
+                if datos["novedades"] is None:
+                    estado.write(f"✅ Promedios de {datos['total_resultados']} usuarios")
                 else:
-                    assignment_weight = 0
-            else:
-                # Si la tarea no está en un grupo de asignación válido, asigna 0%
-                assignment_weight = 0
-
-            # Asegurarse de que la ponderación no exceda el 100% y esté correctamente formateada
-            assignments_with_weights.append({
-                "Tarea": name,
-                "Ponderación": f"{assignment_weight:.1f}%"
-            })
-        
-        return assignments_with_weights
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error al realizar la solicitud: {e}")
-        return []
-
-def get_user_details(user_ids, headers):
+                    estado.write(f"✅ {datos['total_resultados']} resultados sincronizados")
+                with encabezado:
+                    mostrar_sincronizacion(datos["total_resultados"], datos["novedades"])
+            elif evento in ("grupo", "sin_criterios"):
+                listos += 1
+                avance.progress(listos / len(lugares), text=f"Competencias: {listos}/{len(lugares)}")
+                if evento == "grupo":
+                    with lugares[datos[0]].container():
+                        mostrar_grupo(*datos)
+                else:
+                    lugares[datos].empty()
+            elif evento == "fin":
+                estado.update(label="Listo", state="complete", expanded=False)
+                return datos
+    except Exception:
+        estado.update(label="Error al procesar el curso", state="error")
+        raise
+
+def mostrar_panel_depuracion(metricas, elapsed_time):
+    """Tabla de métricas por etapa. Las etapas se solapan, así que su suma puede superar el total."""
+    with st.expander("Depuración: tiempos por etapa", expanded=True):
+        st.caption(f"Tiempo total: {elapsed_time:.2f} s. Las descargas corren en paralelo, "
+                   "así que la suma de las etapas puede ser mayor.")
+        st.dataframe(pd.DataFrame(metricas.filas()), hide_index=True)
+        st.code(metricas.a_prometheus(), language="text")
+
+def forzar_actualizacion(course_ids):
     """
-    Obtiene los detalles de los usuarios dado una lista de user_ids.
-    Retorna una lista de dicts con 'user_id' y 'name'.
+    Vence la caché en disco y la copia local de los cursos, y cambia la versión de
+    la sesión para que el próximo cálculo no se tome de la caché en memoria.
     """
-    user_details = []
-    for user_id in user_ids:
-        try:
-            url = f"{canvas_base_url}/users/{user_id}"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                user_data = response.json()
-                name = user_data.get("name", "Sin nombre")
-                user_details.append({"user_id": user_id, "name": name})
-            else:
-                user_details.append({"user_id": user_id, "name": f"Error {response.status_code}"})
-        except requests.exceptions.RequestException as e:
-            user_details.append({"user_id": user_id, "name": f"Error: {e}"})
-    return user_details
+    client = get_canvas_client(canvas_base_url, canvas_token)
+    client.expire_cache()
+    results_store = get_results_store()
+    for cid in course_ids:
+        results_store.reset(client.cache_scope, cid)
+    st.session_state["version"] = st.session_state.get("version", 0) + 1
 
 # ------------------------------------------------------------------
-# LÓGICA PRINCIPAL: Al hacer clic en "Buscar Competencias"
+# LÓGICA PRINCIPAL: Al hacer clic en "Procesar cursos" o "Buscar Competencias"
+# La consulta se guarda en la sesión para que, al volver a ejecutar el script
+# (p. ej. al cambiar una casilla), se siga mostrando desde la caché en memoria.
 # ------------------------------------------------------------------
 
-if st.button("Buscar Competencias"):
-    with st.spinner("Procesando datos, por favor espera..."):
-        start_time = time.time()
-
-        if not canvas_token or not course_id or not canvas_base_url:
-            st.error("Por favor ingresa al menos un ID de curso.")
-        else:
-            # Encabezados para las llamadas a la API
-            headers = {
-                "Authorization": f"Bearer {canvas_token}",
-            }
-
-            # 1) Obtener TODOS los outcome_results del curso
-            resultados = fetch_all_results(headers, canvas_base_url, course_id)
-            if not resultados:
-                st.warning("No hay competencias en este curso!")
-                st.stop()
-
-            # 2) Obtener información del curso (para mostrar en la interfaz)
-            course_info = get_course_details(course_id, headers)
-            st.subheader(course_info["subaccount_name"])
-            st.markdown(f"###### Curso: {course_info['course_name']} ({course_info['course_code']})")
-            st.divider()
-
-            # 3) Obtener grupos del curso, filtrar los que empiecen con "cd", "cp", "cg"
-            all_groups_data = get_outcome_groups(course_id, headers)
-            if isinstance(all_groups_data, list):
-                groups_list = all_groups_data
-            elif isinstance(all_groups_data, dict):
-                groups_list = all_groups_data.get("outcome_groups", [])
+if modo == "Varios cursos" and st.button("Procesar cursos"):
+    client = get_canvas_client(canvas_base_url, canvas_token)
+
+    # 1) Reunir los IDs de curso desde el texto, el CSV y/o la subcuenta
+    batch_ids = leer_ids_de_cursos(course_ids_text)
+    if course_ids_csv is not None:
+        batch_ids += leer_ids_de_csv(course_ids_csv)
+    if account_id.strip():
+        try:
+            batch_ids += get_account_course_ids(account_id.strip(), client, include_subaccounts)
+        except requests.exceptions.RequestException as e:
+            st.error(f"No se pudieron listar los cursos de la subcuenta {account_id}: {e}")
+    batch_ids = list(dict.fromkeys(batch_ids))
+
+    if not batch_ids:
+        st.error("Por favor ingresa al menos un ID de curso o de subcuenta.")
+        st.stop()
+
+    st.session_state["cursos_consultados"] = tuple(batch_ids)
+    if force_refresh:
+        forzar_actualizacion(batch_ids)
+
+cursos_consultados = st.session_state.get("cursos_consultados")
+if modo == "Varios cursos" and cursos_consultados:
+    start_time = time.time()
+
+    # 2) Procesar los cursos en paralelo, mostrando el avance de cada uno
+    progress_bar = st.progress(0.0, text=f"Procesando {len(cursos_consultados)} cursos...")
+    status_log = st.empty()
+    lineas_estado = []
+
+    def mostrar_avance(hechos, total, cid, error):
+        estado = f"⚠️ {error}" if error else "✅ listo"
+        lineas_estado.append(f"- Curso {cid}: {estado}")
+        progress_bar.progress(hechos / total, text=f"{hechos}/{total} cursos procesados")
+        status_log.markdown("\n".join(lineas_estado[-10:]))
+
+    metricas = Metricas()
+    with instrumentar(metricas):
+        # Cada curso se toma de su instantánea o de la caché en memoria si ya se calculó (ver calcular_curso)
+        version = st.session_state.get("version", 0)
+        resumenes, errores = procesar_cursos(
+            get_canvas_client(canvas_base_url, canvas_token), get_results_store(), list(cursos_consultados),
+            on_progress=mostrar_avance,
+            procesar=lambda cid: (buscar_instantanea(cid)
+                                  or calcular_curso(canvas_base_url, canvas_token, cid, version, fuente)),
+        )
+        progress_bar.empty()
+        status_log.empty()
+
+        # 3) Tabla combinada de todos los cursos
+        with etapa("render"):
+            tabla = tabla_combinada(resumenes, incluir_criterios=show_details)
+            st.subheader(f"Distribución de competencias en {len(resumenes)} cursos")
+            st.dataframe(tabla, hide_index=True)
+            st.download_button("Descargar CSV", tabla.to_csv(index=False).encode("utf-8"),
+                               file_name="competencias.csv", mime="text/csv")
+
+    if errores:
+        with st.expander(f"{len(errores)} cursos sin resultados"):
+            for cid, mensaje in errores.items():
+                st.write(f"Curso {cid}: {mensaje}")
+
+    elapsed_time = time.time() - start_time
+    st.write(f"Tiempo en generar la respuesta: {elapsed_time:.2f} segundos")
+    log_json(metricas, modo="varios", cursos=len(cursos_consultados), segundos=round(elapsed_time, 3))
+    if mostrar_depuracion:
+        mostrar_panel_depuracion(metricas, elapsed_time)
+
+if modo == "Un curso" and st.button("Buscar Competencias"):
+    if not canvas_token or not course_id.strip() or not canvas_base_url:
+        st.error("Por favor ingresa al menos un ID de curso.")
+        st.stop()
+
+    st.session_state["curso_consultado"] = course_id.strip()
+    if force_refresh:
+        forzar_actualizacion([course_id.strip()])
+
+curso_consultado = st.session_state.get("curso_consultado")
+if modo == "Un curso" and curso_consultado:
+    start_time = time.time()
+
+    # 1-6) Si hay una instantánea precalculada se muestra esa; si el curso ya se calculó en
+    # esta sesión, se toma de la caché en memoria; si no, se descarga y se va mostrando
+    # cada competencia apenas está lista
+    version = st.session_state.get("version", 0)
+    calculados = st.session_state.setdefault("calculados", set())
+    metricas = Metricas()
+    with instrumentar(metricas):
+        # Las tareas se descargan en otro hilo, en paralelo con las competencias
+        tareas = None
+        if show_details:
+            pool_tareas = ThreadPoolExecutor(max_workers=1)
+            tareas = pool_tareas.submit(propagar(en_etapa("tareas", calcular_tareas)),
+                                        canvas_base_url, canvas_token, curso_consultado, version)
+            pool_tareas.shutdown(wait=False)
+        try:
+            resumen = buscar_instantanea(curso_consultado)
+            if resumen is not None:
+                mostrar_resumen(curso_consultado, resumen)
+            elif (curso_consultado, version, fuente) in calculados:
+                resumen = calcular_curso(canvas_base_url, canvas_token, curso_consultado, version, fuente)
+                mostrar_resumen(curso_consultado, resumen)
+            else:
+                resumen = mostrar_curso_progresivo(curso_consultado)
+                calcular_curso(canvas_base_url, canvas_token, curso_consultado, version, fuente, _resumen=resumen)
+                calculados.add((curso_consultado, version, fuente))
+        except RuntimeError as e:
+            st.error(str(e))
+            st.stop()
+        except CursoSinCompetencias as e:
+            st.warning(str(e))
+            st.stop()
+
+    # 7) Mostrar tareas y su ponderación si el checkbox está activo (ya se descargaron
+    # mientras se calculaba el curso)
+    if tareas is not None:
+        with etapa("render"):
+            st.subheader("Tareas del Curso y su Ponderación Total")
+            try:
+                # Un error no queda memorizado: st.cache_data no guarda las excepciones
+                assignments_with_weights = tareas.result()
+            except RuntimeError as e:
+                st.error(str(e))
             else:
-                groups_list = []
-
-            # Filtramos grupos cuyo título inicie con "cd", "cp" o "cg" (ignorar mayúsculas).
-            grupos_filtrados = []
-            for g in groups_list:
-                title_lower = g.get("title", "").strip().lower()
-                if title_lower.startswith("cd") or title_lower.startswith("cp") or title_lower.startswith("cg"):
-                    grupos_filtrados.append(g)
-
-            if not grupos_filtrados:
-                st.warning("No se encontraron competencias compatibles en el curso!")
-                st.stop()
-
-            # 4) Para cada grupo filtrado, obtendremos los outcomes (id+title).
-            grupo_to_outcomes_info = {}  # { group_title: [(out_id, out_title), ...], ... }
-
-            for grp in grupos_filtrados:
-                grp_id = grp.get("id")
-                grp_title = grp.get("title", "Sin título")
-                if not grp_id:
-                    continue
-
-                list_outcomes = gather_outcomes_with_titles(course_id, grp_id, headers)
-                if list_outcomes:
-                    grupo_to_outcomes_info[grp_title] = list_outcomes
-
-            if not grupo_to_outcomes_info:
-                st.warning("Las competencias no tienen criterios asociados.")
-                st.stop()
-
-            # 5) Procesar los outcome_results para poder calcular promedios
-            outcome_to_user_scores = defaultdict(lambda: defaultdict(list))
-            excluded_users = set()
-
-            for res in resultados:
-                user_id = res.get("links", {}).get("user")
-                outcome_id_str = res.get("links", {}).get("learning_outcome")
-                percent = res.get("percent", 0.0)
-
-                # Asignar 0.0 si percent es None
-                if percent is None:
-                    percent = 0.0
-
-                # Verificar si percent es numérico
-                if not isinstance(percent, (int, float)):
-                    percent = 0.0  # O asignar otro valor predeterminado
-
-                if outcome_id_str and user_id:
-                    try:
-                        outcome_id = int(outcome_id_str)
-                    except ValueError:
-                        outcome_id = outcome_id_str  # Caso raro
-                    outcome_to_user_scores[outcome_id][user_id].append(percent)
-
-            # Opcional: Identificar estudiantes que tienen todas las notas faltantes (si es necesario)
-            # En este ejemplo, ya asignamos 0.0 a los percent faltantes, por lo que no excluimos a nadie
-
-            # 6) Para cada grupo, calculamos su distribución y, si show_details, el detalle de cada competencia
-            st.markdown("###### Competencias encontradas:")
-
-            for grupo_title, outcomes_list in grupo_to_outcomes_info.items():
-                # 6.1) Construimos user->[perc] para todos los outcomes de este grupo
-                user_scores_in_group = defaultdict(list)
-                for (oid, _title) in outcomes_list:
-                    if oid in outcome_to_user_scores:
-                        for user_id, scores_lst in outcome_to_user_scores[oid].items():
-                            user_scores_in_group[user_id].extend(scores_lst)
-
-                # 6.2) Generamos la tabla de distribución de categorías para TODO el grupo
-                dist_data_grupo = calcular_distribucion_categorias(user_scores_in_group)
-                dist_df_grupo = pd.DataFrame(dist_data_grupo)
-
-                st.markdown(f"#### {grupo_title}")
-                # Aplicamos estilo a la tabla
-                styled_tbl_grupo = style_table(dist_df_grupo)
-                st.write(styled_tbl_grupo.to_html(index=False), unsafe_allow_html=True)
-
-                # 6.3) Si el checkbox "show_details" está activado, mostramos detalle de cada competencia
-                if show_details:
-                    if outcomes_list:
-                        st.markdown("##### :green[**Detalle de cada criterio en esta competencia:**]")
-                        for (oid, otitle) in outcomes_list:
-                            user_scores_competencia = outcome_to_user_scores.get(oid, {})
-                            dist_data_competencia = calcular_distribucion_categorias(user_scores_competencia)
-                            dist_df_competencia = pd.DataFrame(dist_data_competencia)
-
-                            st.markdown(f"**{otitle}**")  # (ID: {oid})
-                            styled_tbl_comp = style_table(dist_df_competencia)
-                            st.write(styled_tbl_comp.to_html(index=False), unsafe_allow_html=True)
-
-                st.divider()
-
-            # 7) Mostrar tareas y su ponderación si el checkbox está activo
-            # if show_details:
-            #     st.subheader("Tareas del Curso y su Ponderación Total")
-            #     assignments_with_weights = get_assignments_with_weights(course_id, canvas_base_url, headers)
-            #     if assignments_with_weights:
-            #         assignments_df = pd.DataFrame(assignments_with_weights)
-            #         assignments_df = assignments_df.rename(columns={"Tarea": "Tarea", "Ponderación": "Ponderación"})
-
-            #         # Aplicar estilos (opcional)
-            #         styles = [
-            #             {'selector': 'th', 'props': [('text-align', 'left')]},
-            #             {'selector': 'td', 'props': [('text-align', 'left')]},
-            #         ]
-
-            #         def highlight_weight(val):
-            #             """
-            #             Resalta la ponderación según el porcentaje.
-            #             Puedes ajustar los rangos y colores según prefieras.
-            #             """
-            #             try:
-            #                 pct = float(val.strip('%'))
-            #                 if pct >= 80:
-            #                     color = '#4CAF50'  # Verde
-            #                 elif pct >= 60:
-            #                     color = '#FFC107'  # Amarillo
-            #                 elif pct >= 40:
-            #                     color = '#FF9800'  # Naranja
-            #                 else:
-            #                     color = '#F44336'  # Rojo
-            #                 return f'background-color: {color}; color: white;'
-            #             except:
-            #                 return ''
-
-            #         styled_assignments = assignments_df.style.set_table_styles(styles).applymap(highlight_weight, subset=['Ponderación'])
-
-            #         st.write(styled_assignments.to_html(index=False), unsafe_allow_html=True)
-            #     else:
-            #         st.warning("No se encontraron tareas con ponderación definida.")
-
-            # 8) Mostrar detalles de los estudiantes excluidos (si los hubiera)
-            # En esta versión, no estamos excluyendo estudiantes, sino asignando 0.0 a los faltantes
-            # Por lo tanto, este paso no es necesario
-
-            elapsed_time = time.time() - start_time
-            st.write(f"Tiempo en generar la respuesta: {elapsed_time:.2f} segundos")
-            st.write("¿Te ahorró tiempo esta app? ¡Espero que sí! 😄")
+                if assignments_with_weights:
+                    st.write(ESTILO_TABLAS + tabla_tareas_html(assignments_with_weights), unsafe_allow_html=True)
+                else:
+                    st.warning("No se encontraron tareas con ponderación definida.")
+
+    # 8) Mostrar detalles de los estudiantes excluidos (si los hubiera)
+    # En esta versión, no estamos excluyendo estudiantes, sino asignando 0.0 a los faltantes
+    # Por lo tanto, este paso no es necesario
+
+    elapsed_time = time.time() - start_time
+    st.write(f"Tiempo en generar la respuesta: {elapsed_time:.2f} segundos")
+    st.write("¿Te ahorró tiempo esta app? ¡Espero que sí! 😄")
+    log_json(metricas, modo="un curso", curso=curso_consultado, segundos=round(elapsed_time, 3))
+    if mostrar_depuracion:
+        mostrar_panel_depuracion(metricas, elapsed_time)
@@ -0,0 +1,92 @@
+"""
+Paridad del cálculo vectorizado (calcular_distribuciones) con el cálculo usuario por
+usuario de calcular_distribucion_categorias, que es como se calculaba originalmente.
+"""
+from collections import defaultdict
+import random
+
+import pytest
+
+from competencias import (
+    AcumuladorResultados,
+    calcular_distribucion_categorias,
+    calcular_distribuciones,
+    resultados_a_dataframe,
+)
+
+# Incluye valores nulos o no numéricos (valen 0.0) y combinaciones cuyo promedio cae
+# exactamente en un umbral salvo ruido de punto flotante (0.1 + 0.7 -> 0.39999999999999997)
+PERCENTS = [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 0.35, 0.45, 0.85, 0.95,
+            None, "n/a", 1, 0]
+
+def _referencia(resultados, grupo_to_outcomes_info):
+    """El cálculo original: user -> [percent] por outcome, y luego por grupo."""
+    outcome_to_user_scores = defaultdict(lambda: defaultdict(list))
+    for res in resultados:
+        user_id = res.get("links", {}).get("user")
+        outcome_id = res.get("links", {}).get("learning_outcome")
+        percent = res.get("percent")
+        if not isinstance(percent, (int, float)):
+            percent = 0.0
+        if outcome_id and user_id:
+            outcome_to_user_scores[int(outcome_id)][user_id].append(percent)
+
+    dist_grupos, dist_criterios = {}, {}
+    for titulo, outcomes_list in grupo_to_outcomes_info.items():
+        user_scores_in_group = defaultdict(list)
+        for oid, _ in outcomes_list:
+            for user_id, scores in outcome_to_user_scores.get(oid, {}).items():
+                user_scores_in_group[user_id].extend(scores)
+        dist_grupos[titulo] = calcular_distribucion_categorias(user_scores_in_group)
+        for oid, _ in outcomes_list:
+            dist_criterios[oid] = calcular_distribucion_categorias(outcome_to_user_scores.get(oid, {}))
+    return dist_grupos, dist_criterios
+
+def _caso(rng):
+    outcomes = list(range(1, rng.randint(2, 7)))
+    usuarios = [str(u) for u in range(100, 100 + rng.randint(1, 12))]
+    resultados = [
+        {"percent": rng.choice(PERCENTS), "links": {"user": u, "learning_outcome": str(o)}}
+        for u in usuarios for o in outcomes for _ in range(rng.randint(0, 3))
+    ]
+    # Resultados sin usuario o sin outcome se ignoran
+    resultados += [{"percent": 0.5, "links": {"user": "", "learning_outcome": "1"}},
+                   {"percent": 0.5, "links": {"user": "100"}}]
+    rng.shuffle(resultados)
+
+    grupos = {}
+    for n in range(rng.randint(1, 3)):
+        miembros = rng.sample(outcomes, rng.randint(1, len(outcomes)))
+        miembros += rng.sample(miembros, rng.randint(0, len(miembros)))  # outcomes repetidos en un grupo
+        grupos[f"CD{n} Competencia"] = [(oid, f"Criterio {oid}") for oid in miembros]
+    return resultados, grupos
+
+def _desde_acumulador(resultados, tam_pagina=7):
+    acumulador = AcumuladorResultados()
+    for i in range(0, len(resultados), tam_pagina):
+        acumulador.agregar(resultados[i:i + tam_pagina])
+    return acumulador.a_dataframe()
+
+@pytest.mark.parametrize("semilla", range(300))
+def test_calcular_distribuciones_igual_al_calculo_original(semilla):
+    resultados, grupos = _caso(random.Random(semilla))
+    esperado = _referencia(resultados, grupos)
+    assert calcular_distribuciones(resultados_a_dataframe(resultados), grupos) == esperado
+    assert calcular_distribuciones(_desde_acumulador(resultados), grupos) == esperado
+
+@pytest.mark.parametrize("scores, categoria", [
+    ([0.1, 0.7], "Cerca del dominio"),       # 0.39999999999999997 cuenta como 0.4
+    ([0.4], "Cerca del dominio"),
+    ([0.3, 0.9], "Reúne el dominio"),         # 0.6
+    ([0.8, 1.0], "Excede el dominio"),        # 0.9
+    ([0.7, 0.7, 0.7, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0], "Excede el dominio"),
+    ([0.39], "Muy por debajo del dominio"),
+])
+def test_promedios_en_los_umbrales(scores, categoria):
+    resultados = [{"percent": p, "links": {"user": "1", "learning_outcome": "5"}} for p in scores]
+    grupos = {"CD1": [(5, "Criterio")]}
+    fila_esperada = {"Categoría": categoria, "Porcentaje": "100.0%"}
+    assert fila_esperada in calcular_distribucion_categorias({"1": scores})
+    for df in (resultados_a_dataframe(resultados), _desde_acumulador(resultados, 1)):
+        dist_grupos, _ = calcular_distribuciones(df, grupos)
+        assert fila_esperada in dist_grupos["CD1"]
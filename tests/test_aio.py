@@ -0,0 +1,98 @@
+"""
+Capa asíncrona (httpx) contra el servidor local de fake_canvas: debe dar lo mismo que la versión con hilos.
+"""
+import asyncio
+
+import pytest
+import requests
+
+from competencias import (
+    CanvasClient,
+    ResultsStore,
+    get_account_course_ids,
+    get_assignments_with_weights,
+    get_user_details,
+    procesar_curso,
+)
+from competencias.aio import (
+    AsyncCanvasClient,
+    ProcesadorAsincrono,
+    get_account_course_ids_async,
+    get_assignments_with_weights_async,
+    get_outcome_groups_async,
+    get_user_details_async,
+    procesar_cursos_async,
+)
+from competencias.fake_canvas import CursoSintetico, FakeCanvas
+from competencias.metrics import Metricas, instrumentar
+from competencias.report import FUENTES
+
+@pytest.fixture
+def curso():
+    return CursoSintetico(1, estudiantes=40, competencias=3, criterios=2, profundidad=2, ramas=2, tareas=5)
+
+@pytest.fixture
+def canvas(curso):
+    with FakeCanvas([curso]) as canvas:
+        yield canvas
+
+@pytest.fixture
+def procesador(canvas):
+    procesador = ProcesadorAsincrono(canvas.base_url, "token-falso")
+    yield procesador
+    procesador.close()
+
+@pytest.mark.parametrize("fuente", FUENTES)
+def test_procesar_curso_igual_que_con_hilos(canvas, procesador, fuente):
+    esperado = procesar_curso(CanvasClient(canvas.base_url, "token-falso"), ResultsStore(":memory:"), "1", fuente)
+    metricas = Metricas()
+    with instrumentar(metricas):
+        resumen = procesador.procesar_curso(ResultsStore(":memory:"), "1", fuente)
+    assert resumen == esperado
+    assert list(resumen["grupo_to_outcomes_info"]) == list(esperado["grupo_to_outcomes_info"])
+    # Las peticiones del loop de fondo se atribuyen a las etapas del hilo que llama
+    assert {"grupos", "curso", "resultados", "árbol"} <= {fila["etapa"] for fila in metricas.filas()}
+
+def test_filtros_y_umbrales(canvas, procesador):
+    opciones = {"filtro": "cd|cp", "filtro_subgrupos": r".* / 1$", "umbrales": [0.95, 0.85, 0.75]}
+    esperado = procesar_curso(CanvasClient(canvas.base_url, "token-falso"), ResultsStore(":memory:"), "1", **opciones)
+    assert procesador.procesar_curso(ResultsStore(":memory:"), "1", **opciones) == esperado
+
+def test_comparte_la_copia_local_con_la_version_con_hilos(canvas, procesador):
+    store = ResultsStore(":memory:")
+    esperado = procesar_curso(CanvasClient(canvas.base_url, "token-falso"), store, "1")
+    resumen = procesador.procesar_curso(store, "1")
+    assert resumen["novedades"] == 0
+    assert resumen["dist_criterios"] == esperado["dist_criterios"]
+
+def test_descargas_sueltas(curso, canvas):
+    client = CanvasClient(canvas.base_url, "token-falso")
+    user_ids = curso.usuarios[:5]
+
+    async def descargar():
+        async with AsyncCanvasClient(canvas.base_url, "token-falso", max_concurrency=2) as aclient:
+            return await asyncio.gather(
+                get_assignments_with_weights_async("1", aclient),
+                get_user_details_async(user_ids, aclient, "1"),
+                get_account_course_ids_async(curso.account_id, aclient),
+            )
+
+    tareas, usuarios, cursos = asyncio.run(descargar())
+    assert tareas == get_assignments_with_weights("1", client)
+    assert usuarios == get_user_details(user_ids, client, "1")
+    assert cursos == get_account_course_ids(curso.account_id, client)
+
+def test_errores_como_en_la_version_con_hilos(canvas):
+    async def descargar(corrutina):
+        async with AsyncCanvasClient(canvas.base_url, "token-falso") as aclient:
+            return await corrutina(aclient)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        asyncio.run(descargar(lambda aclient: get_outcome_groups_async("99", aclient)))
+    with pytest.raises(RuntimeError, match="tareas"):
+        asyncio.run(descargar(lambda aclient: get_assignments_with_weights_async("99", aclient)))
+
+    resumenes, errores = asyncio.run(descargar(
+        lambda aclient: procesar_cursos_async(aclient, ResultsStore(":memory:"), ["1", "99"])))
+    assert [cid for cid, _ in resumenes] == ["1"]
+    assert list(errores) == ["99"]
@@ -0,0 +1,34 @@
+"""
+Descargas de canvas.py contra el servidor local de fake_canvas.
+"""
+import pytest
+import requests
+
+from competencias import CanvasClient, ResultsStore, get_assignments_with_weights, get_outcome_groups, procesar_curso
+from competencias.fake_canvas import CursoSintetico, FakeCanvas
+
+def test_get_outcome_groups_lee_todas_las_paginas():
+    # 12 competencias + "Otros aprendizajes": más que las 10 que Canvas entrega por defecto
+    curso = CursoSintetico(1, estudiantes=5, competencias=12, profundidad=0)
+    with FakeCanvas([curso]) as canvas:
+        client = CanvasClient(canvas.base_url, "token-falso")
+        assert [g["id"] for g in get_outcome_groups("1", client)] == curso.raices
+
+        resumen = procesar_curso(client, ResultsStore(":memory:"), "1")
+        assert len(resumen["dist_grupos"]) == 12
+
+def test_get_outcome_groups_de_un_curso_inexistente():
+    with FakeCanvas([CursoSintetico(1, estudiantes=1)]) as canvas:
+        with pytest.raises(requests.exceptions.HTTPError):
+            get_outcome_groups("99", CanvasClient(canvas.base_url, "token-falso"))
+
+def test_get_assignments_with_weights():
+    # 4 grupos de 25% y 6 tareas: los dos primeros grupos tienen 2 tareas cada uno
+    with FakeCanvas([CursoSintetico(1, estudiantes=1, tareas=6)]) as canvas:
+        tareas = get_assignments_with_weights("1", CanvasClient(canvas.base_url, "token-falso"))
+    assert [t["Ponderación"] for t in tareas] == ["12.5%", "12.5%", "25.0%", "25.0%", "12.5%", "12.5%"]
+
+def test_get_assignments_with_weights_lanza_error_si_falla_la_descarga():
+    with FakeCanvas([CursoSintetico(1, estudiantes=1)]) as canvas:
+        with pytest.raises(RuntimeError, match="tareas"):
+            get_assignments_with_weights("99", CanvasClient(canvas.base_url, "token-falso"))
@@ -0,0 +1,35 @@
+"""
+Reintentos y control de concurrencia de CanvasClient (sin red).
+"""
+import requests
+
+from competencias import CanvasClient
+from competencias import client as client_module
+
+def _respuesta(headers):
+    response = requests.Response()
+    response.status_code = 429
+    response.headers.update(headers)
+    return response
+
+def test_retry_after_es_un_minimo(monkeypatch):
+    esperas = []
+    monkeypatch.setattr(client_module.time, "sleep", esperas.append)
+    client = CanvasClient("http://canvas.invalid/api/v1", "token-falso", backoff=0.5)
+    for _ in range(200):
+        client._sleep(0, _respuesta({"Retry-After": "3"}))
+    assert min(esperas) >= 3
+    assert max(esperas) <= 3.5
+
+def test_una_rafaga_con_poca_cuota_recorta_el_limite_una_sola_vez():
+    client = CanvasClient("http://canvas.invalid/api/v1", "token-falso", max_workers=8)
+    for _ in range(8):
+        client._acquire()
+    for _ in range(8):
+        client._release(_respuesta({"X-Rate-Limit-Remaining": "50"}))
+    assert client._limit == 4
+
+    # Una nueva petición con poca cuota sí vuelve a recortar
+    client._acquire()
+    client._release(_respuesta({"X-Rate-Limit-Remaining": "50"}))
+    assert client._limit == 2
@@ -0,0 +1,83 @@
+"""
+Filtros de grupos y umbrales configurables, desde procesar_curso y desde la línea de comandos.
+"""
+import pandas as pd
+import pytest
+
+from competencias import (
+    CanvasClient,
+    ResultsStore,
+    calcular_distribucion_categorias,
+    clasificar_promedio,
+    clasificar_promedios,
+    procesar_curso,
+    validar_umbrales,
+)
+from competencias.cli import main
+from competencias.fake_canvas import CursoSintetico, FakeCanvas
+
+UMBRALES_ALTOS = [0.95, 0.85, 0.75]
+
+@pytest.fixture
+def canvas():
+    curso = CursoSintetico(1, estudiantes=30, competencias=3, criterios=2, profundidad=2, ramas=2)
+    with FakeCanvas([curso]) as canvas:
+        yield canvas
+
+def test_umbrales_iguales_en_el_camino_escalar_y_el_vectorizado():
+    umbrales = validar_umbrales(UMBRALES_ALTOS)
+    assert validar_umbrales(umbrales) is umbrales
+    promedios = pd.Series([0.0, 0.74, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0])
+    assert list(clasificar_promedios(promedios, UMBRALES_ALTOS)) == [clasificar_promedio(p, umbrales) for p in promedios]
+    with pytest.raises(ValueError):
+        validar_umbrales([0.5])
+
+def test_procesar_curso_con_umbrales(canvas):
+    client = CanvasClient(canvas.base_url, "token-falso")
+    store = ResultsStore(":memory:")
+    normal = procesar_curso(client, store, "1")
+    altos = procesar_curso(client, store, "1", umbrales=UMBRALES_ALTOS)
+    assert normal["dist_grupos"] != altos["dist_grupos"]
+
+    # Cada criterio tiene un resultado por estudiante: su distribución se puede recalcular a mano
+    resultados = store.results(client.cache_scope, "1")
+    oid, _ = next(iter(altos["grupo_to_outcomes_info"].values()))[0]
+    scores = {r["links"]["user"]: [r["percent"]] for r in resultados if r["links"]["learning_outcome"] == str(oid)}
+    assert altos["dist_criterios"][oid] == calcular_distribucion_categorias(scores, UMBRALES_ALTOS)
+
+def test_filtros_de_grupos_y_subgrupos_podan_la_descarga(canvas):
+    client = CanvasClient(canvas.base_url, "token-falso")
+    completo = procesar_curso(client, ResultsStore(":memory:"), "1")
+    peticiones_completo = canvas.peticiones
+
+    canvas.reiniciar_contadores()
+    # Solo CD1 y, dentro de ella, solo la primera rama (títulos "... / 1")
+    podado = procesar_curso(client, ResultsStore(":memory:"), "1", filtro="cd", filtro_subgrupos=r".* / 1$")
+    assert list(podado["dist_grupos"]) == ["CD1 Competencia 1"]
+    # Raíz + rama 1 + su rama 1, con 2 criterios cada una (de 7 nodos en total)
+    assert len(podado["grupo_to_outcomes_info"]["CD1 Competencia 1"]) == 6
+    assert len(completo["grupo_to_outcomes_info"]["CD1 Competencia 1"]) == 14
+    assert canvas.peticiones < peticiones_completo
+
+def test_cli_groups_subgroups_thresholds(canvas, tmp_path, monkeypatch):
+    monkeypatch.setenv("TOKEN", "token-falso")
+    salida = tmp_path / "competencias.csv"
+    args = ["report", "--course", "1", "--base-url", canvas.base_url, "--cache-path", str(tmp_path / "cache.sqlite"),
+            "--details", "-o", str(salida), "--groups", "cp|cg", "--subgroups", r".* / 2$",
+            "--thresholds", ",".join(map(str, UMBRALES_ALTOS))]
+    assert main(args) == 0
+
+    tabla = pd.read_csv(salida)
+    client = CanvasClient(canvas.base_url, "token-falso")
+    esperado = procesar_curso(client, ResultsStore(":memory:"), "1", filtro="cp|cg", filtro_subgrupos=r".* / 2$",
+                              umbrales=UMBRALES_ALTOS)
+    grupos = tabla[tabla["Criterio"].isna()]
+    assert sorted(grupos["Competencia"]) == sorted(esperado["dist_grupos"])
+    for _, fila in grupos.iterrows():
+        dist = {d["Categoría"]: d["Porcentaje"] for d in esperado["dist_grupos"][fila["Competencia"]]}
+        assert all(fila[cat] == pct for cat, pct in dist.items())
+
+def test_cli_rechaza_umbrales_invalidos(capsys):
+    with pytest.raises(SystemExit):
+        main(["report", "--course", "1", "--thresholds", "0.5"])
+    assert "umbrales" in capsys.readouterr().err
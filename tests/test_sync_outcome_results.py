@@ -0,0 +1,54 @@
+"""
+Sincronización incremental de outcome_results contra el servidor local de fake_canvas.
+"""
+import pytest
+
+from competencias import CanvasClient, ResultsStore, fetch_all_results, sync_outcome_results
+from competencias.fake_canvas import CursoSintetico, FakeCanvas
+
+def _curso(cantidad):
+    """Curso con exactamente 'cantidad' outcome_results (Canvas los pagina de a 100)."""
+    curso = CursoSintetico(1, estudiantes=100, competencias=1, criterios=2, profundidad=0)
+    del curso.resultados[cantidad:]
+    return curso
+
+def _nuevos_resultados(curso, cantidad):
+    """Agrega 'cantidad' resultados nuevos al final del listado del curso."""
+    user_id, outcome_id = curso.usuarios[0], next(iter(curso.outcomes))
+    inicio = max(r["id"] for r in curso.resultados) + 1
+    curso.resultados.extend(
+        {"id": inicio + n, "percent": 0.5, "submitted_or_assessed_at": "2025-01-01T12:00:00Z",
+         "links": {"user": str(user_id), "learning_outcome": str(outcome_id)}}
+        for n in range(cantidad)
+    )
+
+@pytest.mark.parametrize("iniciales, agregados", [(100, 1), (150, 60), (200, 0)])
+def test_sync_ve_las_paginas_nuevas(iniciales, agregados):
+    curso = _curso(iniciales)
+    with FakeCanvas([curso]) as canvas:
+        client = CanvasClient(canvas.base_url, "token-falso")
+        store = ResultsStore(":memory:")
+        resultados, _ = sync_outcome_results(client, store, "1")
+        assert len(resultados) == iniciales
+
+        _nuevos_resultados(curso, agregados)
+        for _ in range(2):
+            resultados, novedades = sync_outcome_results(client, store, "1")
+            assert len(resultados) == iniciales + agregados
+            assert resultados == fetch_all_results(client, "1")
+        assert novedades == 0
+
+def test_sync_cuenta_novedades_y_descarta_paginas_sobrantes():
+    curso = _curso(250)
+    with FakeCanvas([curso]) as canvas:
+        client = CanvasClient(canvas.base_url, "token-falso")
+        store = ResultsStore(":memory:")
+        sync_outcome_results(client, store, "1")
+
+        _nuevos_resultados(curso, 3)
+        assert sync_outcome_results(client, store, "1")[1] == 3
+
+        del curso.resultados[120:]
+        resultados, _ = sync_outcome_results(client, store, "1")
+        assert resultados == fetch_all_results(client, "1")
+        assert store.state(client.cache_scope, "1")[0] == 2